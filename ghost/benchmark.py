@@ -0,0 +1,158 @@
+''' benchmark.py
+Benchmarks every available lexicon backend: the time to build it, its
+resident memory, and p50/p99 latencies of has_prefix, has_word and
+valid_continuations over fragments like the ones seen in games. Each
+backend is measured in a fresh process so memory readings do not mix.
+
+    python benchmark.py [RESULTS_FILE] [BASELINE_FILE]
+
+Results are written as JSON (RESULTS_FILE, lexicon_benchmark.json by
+default). With a baseline, changes of more than 10% are reported.
+'''
+
+import json
+import multiprocessing
+import random
+import resource
+import sys
+import time
+import timeit
+import lexicon
+from dawg import Dawg
+
+RESULTS_FILE = 'lexicon_benchmark.json'
+NUM_QUERIES = 20000
+SEED = 2006
+THRESHOLD = 0.1 # relative change worth reporting against a baseline
+
+# Internal functions
+def _resident_bytes():
+    ''' Current resident set size, from /proc when there is one '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _fragments(words, count, seed=SEED):
+    ''' Fragments as they come up in games: prefixes of words, a fifth of
+    them with a stray letter on the end (mostly not prefixes any more)
+    '''
+    rng = random.Random(seed)
+    fragments = []
+    for _ in xrange(count):
+        word = rng.choice(words)
+        fragment = word[:rng.randint(1, len(word))]
+        if rng.random() < 0.2:
+            fragment += rng.choice('abcdefghijklmnopqrstuvwxyz')
+        fragments.append(fragment)
+    return fragments
+
+def _latencies(query, fragments):
+    ''' p50 and p99 latency of query in microseconds '''
+    times = []
+    timer = timeit.default_timer
+    for fragment in fragments:
+        start = timer()
+        query(fragment)
+        times.append(timer() - start)
+    times.sort()
+    return {'p50_us': times[len(times) // 2] * 1e6,
+            'p99_us': times[int(len(times) * 0.99)] * 1e6}
+
+def _load_backend(backend):
+    if backend == 'compiled':
+        return Dawg.load(lexicon.COMPILED_FILE)
+    return lexicon._build(lexicon._read_words(lexicon.WORDS_FILE), backend)
+
+def _measure(args):
+    ''' Runs in a fresh worker process '''
+    backend, fragments = args
+    rss_before = _resident_bytes()
+    start = timeit.default_timer()
+    lexicon._lexicon = _load_backend(backend)
+    build_seconds = timeit.default_timer() - start
+    rss_built = _resident_bytes()
+    result = {'build_seconds': build_seconds,
+              'resident_bytes': rss_built - rss_before}
+    # resident memory includes what building left behind, so also report
+    # the size of the structure itself where it is known
+    if isinstance(lexicon._lexicon, Dawg):
+        result['structure_bytes'] = lexicon._lexicon.nbytes()
+    for name in ('has_prefix', 'has_word', 'valid_continuations'):
+        result[name] = _latencies(getattr(lexicon, name), fragments)
+    # the mmap'd backend only becomes resident as it is queried
+    result['resident_bytes_after_queries'] = _resident_bytes() - rss_before
+    return result
+
+def _flatten(results, prefix=''):
+    ''' {'a': {'b': 1}} -> {'a.b': 1} '''
+    flat = {}
+    for key, value in results.iteritems():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+# Public functions
+def available_backends():
+    backends = ['trie', 'dawg']
+    if Dawg.header(lexicon.COMPILED_FILE) is not None:
+        backends.append('compiled')
+    return backends
+
+def run(backends=None, num_queries=NUM_QUERIES):
+    ''' Returns the benchmark results for each backend as a dict '''
+    with open(lexicon.WORDS_FILE) as f:
+        words = [line.strip().lower() for line in f if line.strip()]
+    fragments = _fragments(words, num_queries)
+    results = {}
+    for backend in backends or available_backends():
+        pool = multiprocessing.Pool(1)
+        try:
+            results[backend] = pool.apply(_measure, [(backend, fragments)])
+        finally:
+            pool.close()
+            pool.join()
+    return {'timestamp': time.time(),
+            'words_file': lexicon.WORDS_FILE,
+            'num_queries': num_queries,
+            'backends': results}
+
+def compare(results, baseline, threshold=THRESHOLD):
+    ''' Returns (metric, baseline, current) for every metric that changed by
+    more than threshold (all metrics are better when lower)
+    '''
+    current = _flatten(results['backends'])
+    previous = _flatten(baseline['backends'])
+    changes = []
+    for metric in sorted(set(current) & set(previous)):
+        old, new = previous[metric], current[metric]
+        if old and abs(new - old) / float(old) > threshold:
+            changes.append((metric, old, new))
+    return changes
+
+if __name__ == '__main__':
+    results_file = sys.argv[1] if len(sys.argv) > 1 else RESULTS_FILE
+    results = run()
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print
+    for backend, result in sorted(results['backends'].iteritems()):
+        print '{0}: built in {1}s, {2} MB resident'.format(
+            backend, round(result['build_seconds'], 3),
+            round(result['resident_bytes'] / 2.0 ** 20, 1)),
+        if 'structure_bytes' in result:
+            print '({0} MB of arrays)'.format(
+                round(result['structure_bytes'] / 2.0 ** 20, 1)),
+        print
+        for name in ('has_prefix', 'has_word', 'valid_continuations'):
+            print '  {0}: p50 {1:.1f}us p99 {2:.1f}us'.format(
+                name, result[name]['p50_us'], result[name]['p99_us'])
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as f:
+            baseline = json.load(f)
+        for metric, old, new in compare(results, baseline):
+            print '{0}: {1:.4g} -> {2:.4g} ({3:+.0%})'.format(
+                metric, old, new, (new - old) / old)
@@ -0,0 +1,595 @@
+''' dawg.py
+A minimized directed acyclic word graph (DAWG) stored in flat arrays.
+Words are inserted in sorted order and equivalent suffixes are merged
+as the graph is built (Daciuk et al., 2000). The finished graph is frozen
+into three flat arrays, so a node is just an integer index:
+
+    nodes[i]    (index of node i's first edge << 1) | end-of-word bit
+    labels      edge letters, edges of a node are contiguous and sorted
+    targets     the node each edge leads to
+
+nodes has one extra entry at the end so a node's edges always run from
+nodes[i] >> 1 to nodes[i + 1] >> 1.
+
+Every node is also annotated with facts about the words below it: how
+many there are, the fewest and most letters needed to reach one, and the
+first letter on the way to the nearest one. They only depend on the set
+of suffixes below a node, so they are the same for every path into it.
+
+A Dawg can be saved to a binary file and loaded back with mmap, in which
+case the arrays are read straight out of the (shared) file pages. It can
+also be copied into anonymous shared memory for forked processes.
+
+A MutableDawg is thawed from a Dawg when words need to be added or removed
+one at a time, in any order. It stays minimal after every edit, and can
+be frozen back into a Dawg.
+'''
+
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from collections import deque
+from cStringIO import StringIO
+
+ROOT = 0
+
+# File layout: header, nodes, targets, labels, then the annotations:
+# word counts, min depths, max depths, shortest letters
+_MAGIC = 'DAWG'
+_VERSION = 2
+_HEADER = struct.Struct('<4sBcxxIIQd') # magic, version, byte order,
+                                       # nodes, edges, source size/mtime
+_BYTE_ORDER = {'little': '<', 'big': '>'}[sys.byteorder]
+_ANNOTATION_TYPES = 'IBBB'
+
+# Internal classes
+class _State(object):
+    ''' A mutable node, only used while the graph is being built '''
+    def __init__(self):
+        self.next = {}
+        self.eow = False # end of word marker
+        self.id = None   # set once the state is registered
+
+    def key(self):
+        ''' Equivalent states have equal keys (all children are registered) '''
+        return (self.eow,) + tuple((letter, self.next[letter].id)
+                                   for letter in sorted(self.next))
+
+class _MutableState(_State):
+    ''' A state of a MutableDawg, which also tracks its number of incoming
+    edges and its annotations
+    '''
+    def __init__(self, id):
+        _State.__init__(self)
+        self.id = id
+        self.refs = 0
+        self.count = 0
+        self.min_depth = 0
+        self.max_depth = 0
+        self.shortest = None
+
+    def annotate(self):
+        ''' Recomputes the annotations from the children's '''
+        self.count = int(self.eow)
+        self.min_depth = 0 if self.eow else None
+        self.max_depth = 0
+        self.shortest = None
+        for letter in sorted(self.next):
+            child = self.next[letter]
+            self.count += child.count
+            self.max_depth = max(self.max_depth, child.max_depth + 1)
+            if self.min_depth is None or child.min_depth + 1 < self.min_depth:
+                self.min_depth, self.shortest = child.min_depth + 1, letter
+        self.min_depth = self.min_depth or 0 # None only for an empty lexicon
+
+class _ArrayView(object):
+    ''' Read-only array-like view of numbers of one typecode in a buffer '''
+    def __init__(self, buffer, offset, length, typecode='I'):
+        self._buffer = buffer
+        self._offset = offset
+        self._length = length
+        self._typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        self._unpack = struct.Struct('=' + typecode).unpack_from
+
+    def nbytes(self):
+        return self._length * self.itemsize
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, _ = i.indices(self._length)
+            return array(self._typecode,
+                         self._buffer[self._offset + start * self.itemsize:
+                                      self._offset + stop * self.itemsize])
+        if not 0 <= i < self._length:
+            raise IndexError('index out of range')
+        return self._unpack(self._buffer, self._offset + i * self.itemsize)[0]
+
+class _BytesView(object):
+    ''' Read-only str-like view of a region of a buffer '''
+    def __init__(self, buffer, offset, length):
+        self._buffer = buffer
+        self._offset = offset
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, _ = i.indices(self._length)
+            return self._buffer[self._offset + start:self._offset + stop]
+        return self._buffer[self._offset + i]
+
+def _annotate(nodes, labels, targets):
+    ''' Computes the annotations of every node by an iterative post-order
+    walk: (word counts, min depths, max depths, shortest letters)
+    '''
+    num_nodes = len(nodes) - 1
+    counts = array('I', [0]) * num_nodes
+    min_depths = array('B', [0]) * num_nodes
+    max_depths = array('B', [0]) * num_nodes
+    shortest = array('B', [0]) * num_nodes # 0 when the node is a word
+    done = bytearray(num_nodes)
+    stack = [ROOT] if num_nodes else []
+    while stack:
+        node = stack[-1]
+        if done[node]:
+            stack.pop()
+            continue
+        start, end = nodes[node] >> 1, nodes[node + 1] >> 1
+        pending = [child for child in targets[start:end] if not done[child]]
+        if pending:
+            stack.extend(pending) # come back once they are annotated
+            continue
+        eow = nodes[node] & 1
+        count, low, high, letter = eow, 0 if eow else None, 0, 0
+        for i in range(start, end):
+            child = targets[i]
+            count += counts[child]
+            high = max(high, max_depths[child] + 1)
+            if low is None or min_depths[child] + 1 < low:
+                low, letter = min_depths[child] + 1, ord(labels[i])
+        counts[node] = count
+        min_depths[node] = low or 0 # None only for an empty lexicon
+        max_depths[node] = high
+        shortest[node] = letter
+        done[node] = 1
+        stack.pop()
+    return counts, min_depths, max_depths, shortest
+
+# Public classes
+class DawgBuilder(object):
+    ''' Builds a minimized Dawg from words inserted in sorted order '''
+    def __init__(self):
+        self._root = _State()
+        self._previous = ''
+        self._unchecked = [] # (parent, letter, child) along the last word
+        self._register = {}
+
+    def insert(self, word):
+        if not word or word == self._previous:
+            return
+        if word < self._previous:
+            raise ValueError('words must be inserted in sorted order')
+        common = 0
+        for a, b in zip(word, self._previous):
+            if a != b:
+                break
+            common += 1
+        self._minimize(common)
+        node = self._unchecked[-1][2] if self._unchecked else self._root
+        for letter in word[common:]:
+            child = _State()
+            node.next[letter] = child
+            self._unchecked.append((node, letter, child))
+            node = child
+        node.eow = True
+        self._previous = word
+
+    def finish(self):
+        ''' Returns the frozen Dawg '''
+        self._minimize(0)
+        return Dawg.freeze(self._root)
+
+    def _minimize(self, down_to):
+        while len(self._unchecked) > down_to:
+            parent, letter, child = self._unchecked.pop()
+            key = child.key()
+            if key in self._register:
+                parent.next[letter] = self._register[key]
+            else:
+                child.id = len(self._register)
+                self._register[key] = child
+
+class Dawg(object):
+    ''' A read-only minimized DAWG. Nodes are integers, ROOT is the root. '''
+    root = ROOT
+
+    def __init__(self, nodes, labels, targets, annotations=None):
+        self._nodes = nodes
+        self._labels = labels
+        self._targets = targets
+        if annotations is None:
+            annotations = _annotate(nodes, labels, targets)
+        self._counts, self._min_depths, self._max_depths, self._shortest = \
+            annotations
+
+    @classmethod
+    def from_words(cls, words):
+        ''' Builds a Dawg from any iterable of words, sorted or not '''
+        builder = DawgBuilder()
+        for word in sorted(set(words)):
+            builder.insert(word)
+        return builder.finish()
+
+    @classmethod
+    def freeze(cls, root):
+        ''' Lays out a graph of _States breadth first, root first '''
+        ids = {id(root): ROOT}
+        order = [root]
+        queue = deque(order)
+        while queue:
+            state = queue.popleft()
+            for letter in sorted(state.next):
+                child = state.next[letter]
+                if id(child) not in ids:
+                    ids[id(child)] = len(order)
+                    order.append(child)
+                    queue.append(child)
+        nodes, labels, targets = array('I'), [], array('I')
+        for state in order:
+            nodes.append(len(targets) << 1 | state.eow)
+            for letter in sorted(state.next):
+                labels.append(letter)
+                targets.append(ids[id(state.next[letter])])
+        nodes.append(len(targets) << 1)
+        return cls(nodes, ''.join(labels), targets)
+
+    def save(self, path, source=(0, 0.0)):
+        ''' Writes the Dawg to a binary file that load() can map.
+        source is the (size, mtime) of the words file it was built from.
+        '''
+        with open(path, 'wb') as f:
+            self._write(f, source)
+
+    def share(self):
+        ''' Returns a copy of the Dawg in an anonymous shared mapping, which
+        processes forked afterwards use without copying
+        '''
+        contents = StringIO()
+        self._write(contents)
+        contents = contents.getvalue()
+        buffer = mmap.mmap(-1, len(contents)) # MAP_SHARED by default
+        buffer.write(contents)
+        return Dawg.from_buffer(buffer)
+
+    def _write(self, f, source=(0, 0.0)):
+        f.write(_HEADER.pack(_MAGIC, _VERSION, _BYTE_ORDER, len(self),
+                             self.num_edges(), source[0], source[1]))
+        f.write(array('I', self._nodes).tostring())
+        f.write(array('I', self._targets).tostring())
+        f.write(self._labels[:len(self._labels)])
+        for typecode, annotation in zip(_ANNOTATION_TYPES,
+                                        self._annotations()):
+            f.write(array(typecode, annotation).tostring())
+
+    @classmethod
+    def header(cls, path):
+        ''' Returns the (size, mtime) of the source words file recorded in
+        a saved Dawg, or None if path is not a usable Dawg file.
+        '''
+        try:
+            with open(path, 'rb') as f:
+                fields = _HEADER.unpack(f.read(_HEADER.size))
+        except (IOError, struct.error):
+            return None
+        magic, version, byte_order, nodes, edges, size, mtime = fields
+        if (magic, version, byte_order) != (_MAGIC, _VERSION, _BYTE_ORDER):
+            return None
+        return size, mtime
+
+    @classmethod
+    def load(cls, path):
+        ''' Maps a file written by save(). Nothing is copied into memory. '''
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(buffer)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        ''' Wraps a buffer holding the contents of a saved Dawg '''
+        magic, version, byte_order, num_nodes, num_edges, _, _ = \
+            _HEADER.unpack_from(buffer, 0)
+        if (magic, version, byte_order) != (_MAGIC, _VERSION, _BYTE_ORDER):
+            raise ValueError('not a compatible dawg file')
+        offset = _HEADER.size
+        nodes = _ArrayView(buffer, offset, num_nodes + 1)
+        offset += nodes.nbytes()
+        targets = _ArrayView(buffer, offset, num_edges)
+        offset += targets.nbytes()
+        labels = _BytesView(buffer, offset, num_edges)
+        offset += num_edges
+        annotations = []
+        for typecode in _ANNOTATION_TYPES:
+            annotations.append(_ArrayView(buffer, offset, num_nodes,
+                                          typecode))
+            offset += annotations[-1].nbytes()
+        return cls(nodes, labels, targets, annotations)
+
+    def __len__(self):
+        ''' Number of nodes '''
+        return len(self._nodes) - 1
+
+    def num_edges(self):
+        return len(self._targets)
+
+    def nbytes(self):
+        ''' Size of the arrays behind the Dawg '''
+        return sum(len(part) * (1 if isinstance(part, (str, _BytesView))
+                                else part.itemsize)
+                   for part in (self._nodes, self._labels, self._targets) +
+                   self._annotations())
+
+    def checksum(self):
+        ''' CRC of the nodes (with their word bits), edge labels and edge
+        targets, to match saved data to its Dawg
+        '''
+        crc = zlib.crc32(self._labels[:len(self._labels)])
+        crc = zlib.crc32(self._nodes[:len(self._nodes)].tostring(), crc)
+        return zlib.crc32(self._targets[:len(self._targets)].tostring(), crc)
+
+    def child(self, node, letter):
+        ''' Returns the node reached from node by letter, or None '''
+        if len(letter) != 1:
+            return None
+        start = self._nodes[node] >> 1
+        end = self._nodes[node + 1] >> 1
+        i = self._labels[start:end].find(letter)
+        if i < 0:
+            return None
+        return self._targets[start + i]
+
+    def is_word(self, node):
+        return bool(self._nodes[node] & 1)
+
+    def letters(self, node):
+        start = self._nodes[node] >> 1
+        end = self._nodes[node + 1] >> 1
+        return list(self._labels[start:end])
+
+    def children(self, node):
+        ''' Returns a list of (letter, node) pairs '''
+        start = self._nodes[node] >> 1
+        end = self._nodes[node + 1] >> 1
+        return zip(self._labels[start:end], self._targets[start:end])
+
+    def traverse(self, str, node=ROOT):
+        ''' Returns the node reached by following str from node, or None '''
+        for letter in str:
+            node = self.child(node, letter)
+            if node is None:
+                return None
+        return node
+
+    def _annotations(self):
+        return self._counts, self._min_depths, self._max_depths, \
+            self._shortest
+
+    def word_count(self, node):
+        ''' Number of words at or below node '''
+        return self._counts[node]
+
+    def depth_range(self, node):
+        ''' Fewest and most letters to add to reach a word below node '''
+        return self._min_depths[node], self._max_depths[node]
+
+    def shortest_word(self, node, prefix=''):
+        ''' The shortest word below node (the first in sorted order among
+        the shortest), where prefix is the path to node
+        '''
+        letters = [prefix]
+        letter = self._shortest[node]
+        while letter:
+            node = self.child(node, chr(letter))
+            letters.append(chr(letter))
+            letter = self._shortest[node]
+        return ''.join(letters)
+
+    def words(self, node=ROOT, prefix=''):
+        ''' Yields every word below node in sorted order '''
+        stack = [(node, prefix)]
+        while stack:
+            node, prefix = stack.pop()
+            if self.is_word(node):
+                yield prefix
+            for letter, child in reversed(self.children(node)):
+                stack.append((child, prefix + letter))
+
+    def debug_full(self, node=ROOT, depth=0):
+        for letter, child in self.children(node):
+            print '\t' * depth, letter, '--> [' + \
+                ', '.join(self.letters(child)) + ']',
+            if self.is_word(child):
+                print 'EOW',
+            print
+            self.debug_full(child, depth + 1)
+
+class MutableDawg(object):
+    ''' A minimized DAWG that stays minimal as single words are added or
+    removed, in any order (Daciuk et al., 2000, section 4): the path of
+    the edited word is made private by cloning shared states, edited,
+    then merged back into the register of states from the bottom up.
+    Nodes are state objects; the interface is otherwise that of Dawg.
+    '''
+    def __init__(self, dawg=None):
+        self._register = {}
+        self._num_ids = 0
+        self.root = self._new_state() # never registered, never merged
+        if dawg is not None:
+            self._thaw(dawg)
+
+    def _new_state(self):
+        self._num_ids += 1
+        return _MutableState(self._num_ids - 1)
+
+    def _thaw(self, dawg):
+        ''' Copies a frozen Dawg, which is already minimal '''
+        states = [self.root] + [self._new_state()
+                                for _ in xrange(len(dawg) - 1)]
+        for node, state in enumerate(states):
+            state.eow = dawg.is_word(node)
+            for letter, child in dawg.children(node):
+                state.next[letter] = states[child]
+                states[child].refs += 1
+            state.count = dawg.word_count(node)
+            state.min_depth, state.max_depth = dawg.depth_range(node)
+            letter = dawg._shortest[node]
+            state.shortest = chr(letter) if letter else None
+        for state in states[1:]:
+            self._register[state.key()] = state
+
+    def _unregister(self, state):
+        key = state.key()
+        if self._register.get(key) is state:
+            del self._register[key]
+
+    def _private_path(self, word):
+        ''' States along the longest prefix of word in the graph, cloned
+        where they are shared, and unregistered since they will change
+        '''
+        path = [self.root]
+        for letter in word:
+            parent = path[-1]
+            child = parent.next.get(letter)
+            if child is None:
+                break
+            if child.refs > 1:
+                clone = self._new_state()
+                clone.eow = child.eow
+                clone.next = dict(child.next)
+                for grandchild in clone.next.itervalues():
+                    grandchild.refs += 1
+                child.refs -= 1
+                clone.refs = 1
+                parent.next[letter] = child = clone
+            else:
+                self._unregister(child)
+            path.append(child)
+        return path
+
+    def _delete(self, state):
+        ''' Drops an unreferenced state, and whatever only it referenced '''
+        stack = [state]
+        while stack:
+            state = stack.pop()
+            self._unregister(state)
+            for child in state.next.itervalues():
+                child.refs -= 1
+                if not child.refs:
+                    stack.append(child)
+
+    def _reminimize(self, path, word):
+        ''' Merges the states of path, deepest first, into the register '''
+        for i in range(len(path) - 1, 0, -1):
+            state, parent = path[i], path[i - 1]
+            state.annotate()
+            key = state.key()
+            equivalent = self._register.get(key)
+            if equivalent is None:
+                self._register[key] = state
+            elif equivalent is not state:
+                parent.next[word[i - 1]] = equivalent
+                equivalent.refs += 1
+                state.refs -= 1
+                self._delete(state)
+        self.root.annotate()
+
+    def add_word(self, word):
+        ''' Adds word. Returns False if it was already there. '''
+        if not word or self.has_word(word):
+            return False
+        path = self._private_path(word)
+        node = path[-1]
+        for letter in word[len(path) - 1:]:
+            child = self._new_state()
+            child.refs = 1
+            node.next[letter] = child
+            path.append(child)
+            node = child
+        node.eow = True
+        self._reminimize(path, word)
+        return True
+
+    def remove_word(self, word):
+        ''' Removes word. Returns False if it was not there. '''
+        if not self.has_word(word):
+            return False
+        path = self._private_path(word)
+        path[-1].eow = False
+        # prune the states that no longer lead to any word
+        while len(path) > 1 and not path[-1].eow and not path[-1].next:
+            state = path.pop()
+            del path[-1].next[word[len(path) - 1]]
+        self._reminimize(path, word[:len(path) - 1])
+        return True
+
+    def freeze(self):
+        return Dawg.freeze(self.root)
+
+    def __len__(self):
+        ''' Number of nodes '''
+        return len(self._register) + 1
+
+    def has_word(self, word):
+        node = self.traverse(word)
+        return node is not None and node.eow
+
+    def child(self, node, letter):
+        return node.next.get(letter)
+
+    def is_word(self, node):
+        return node.eow
+
+    def letters(self, node):
+        return sorted(node.next)
+
+    def children(self, node):
+        return sorted(node.next.items())
+
+    def traverse(self, str, node=None):
+        node = self.root if node is None else node
+        for letter in str:
+            node = node.next.get(letter)
+            if node is None:
+                return None
+        return node
+
+    def word_count(self, node):
+        return node.count
+
+    def depth_range(self, node):
+        return node.min_depth, node.max_depth
+
+    def shortest_word(self, node, prefix=''):
+        letters = [prefix]
+        while node.shortest:
+            letters.append(node.shortest)
+            node = node.next[node.shortest]
+        return ''.join(letters)
+
+    def words(self, node=None, prefix=''):
+        ''' Yields every word below node in sorted order '''
+        stack = [(self.root if node is None else node, prefix)]
+        while stack:
+            node, prefix = stack.pop()
+            if node.eow:
+                yield prefix
+            for letter, child in reversed(self.children(node)):
+                stack.append((child, prefix + letter))
+
@@ -0,0 +1,109 @@
+''' engine.py
+Plays Ghost without any console I/O, using the rules and result codes of
+the Ghost class. Game holds the state of one game and is fed one move at
+a time; play_game plays a whole game between two GhostPlayers.
+'''
+
+import timeit
+import lexicon
+from ghost import Ghost
+
+_MAX_RETRIES = 100 # a player that keeps making illegal moves is broken
+
+class Game(object):
+    ''' The state of one game. Player 0 moves first. Each move is an O(1)
+    step: the fragment is followed through the lexicon with a cursor.
+    '''
+    def __init__(self):
+        self.fragment = ''
+        self.current, self.opponent = 0, 1
+        self.challenged = False # waiting for the opponent's word
+        self.result = None
+        self.winner = None
+        self.word = '' # the challenged player's answer
+        self._position = lexicon.cursor()
+
+    def over(self):
+        return self.result is not None
+
+    def move(self, letter):
+        ''' Plays letter (or '!') for the current player. Raises ValueError
+        with Ghost's message if the move is not legal.
+        '''
+        if self.over() or self.challenged:
+            raise ValueError('Not expecting a move')
+        error = Ghost.check_move(letter, self.fragment)
+        if error:
+            raise ValueError(error)
+        letter = letter.lower() # the lexicon is all lowercase
+        # a challenge was issued
+        if letter == '!':
+            self.challenged = True
+        # just adding a letter
+        else:
+            self.fragment += letter
+            if self._position.push(letter).has_word(Ghost._MIN_WORD_LENGTH):
+                self._finish(Ghost._FORMED_WORD)
+            else:
+                self.current, self.opponent = self.opponent, self.current
+
+    def answer(self, word):
+        ''' The challenged opponent's word for the current fragment '''
+        if not self.challenged or self.over():
+            raise ValueError('Not expecting a word')
+        self.word = word.strip()
+        self._finish(Ghost.challenge_result(self.fragment, self.word))
+
+    def _finish(self, result):
+        ''' The result is always from the point of view of the current
+        player, like in Ghost.process_result
+        '''
+        self.result = result
+        if result == Ghost._WON_CHALLENGE:
+            self.winner = self.current
+        else:
+            self.winner = self.opponent
+
+def get_next_letter(player, fragment, latencies=None):
+    ''' Asks player for a move until it makes a legal one, like
+    Ghost.get_next_letter does. Appends each try's time to latencies.
+    '''
+    for _ in range(_MAX_RETRIES):
+        start = timeit.default_timer()
+        letter = player.get_next_letter(fragment)
+        if latencies is not None:
+            latencies.append(timeit.default_timer() - start)
+        if not Ghost.check_move(letter, fragment):
+            return letter
+    raise ValueError('{0} made {1} illegal moves in a row'.format(
+        player.get_name(), _MAX_RETRIES))
+
+def play_game(players, latencies=None, log=None):
+    ''' Plays one game, players[0] moving first.
+
+    Returns (winner, result, fragment): the index of the winning player,
+    one of Ghost's result codes, and the final fragment. If latencies is
+    a pair of lists, each move's time in seconds is appended to the list of
+    the player who made it. If log is a gamelog.GameLog, the game is
+    recorded in it.
+    '''
+    if latencies is None:
+        latencies = ([], [])
+    game = Game()
+    moves = []
+    times = []
+    while not game.over():
+        if game.challenged:
+            game.answer(players[game.opponent].get_word(game.fragment))
+        else:
+            start = timeit.default_timer()
+            letter = get_next_letter(players[game.current], game.fragment,
+                                     latencies[game.current])
+            times.append(timeit.default_timer() - start)
+            moves.append(letter.lower())
+            game.move(letter)
+    if log is not None:
+        # the class names tell bots apart, they all call themselves COMPUTER
+        log.record([type(player).__name__ for player in players], moves,
+                   game.result, game.winner, times, game.word)
+    return game.winner, game.result, game.fragment
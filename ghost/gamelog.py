@@ -0,0 +1,284 @@
+''' gamelog.py
+Records every game in an append-only binary log, and analyzes logs of
+any size in one streaming pass. A log is a 5 byte file header ('GLOG' and
+a version) followed by records, each a fixed-size header and a payload:
+
+    name    kind, name length, player id; then the name. Written the first
+            time a player appears in the log.
+    game    kind, result code, winner, flags, the two player ids (in the
+            order they moved), number of moves, length of the challenged
+            player's word, start time and payload length; then each move
+            as a varint (0 for '!', 1-26 for a letter, 27-52 for a
+            Superghost '<' letter), each move's time in microseconds as a
+            varint, and the word.
+
+Result codes are Ghost's, from the point of view of the player who made
+the last move; the winner is 0 for the player who moved first, 1 for the
+other. Each game is written with a single write(), together with the
+names it introduces, so a log that was cut short loses at most its last
+game, and is trimmed back to the last whole one when it is reopened.
+
+    python gamelog.py LOG [LOG...]
+'''
+
+import collections
+import os
+import string
+import struct
+import sys
+import time
+
+_MAGIC = 'GLOG'
+_VERSION = 1
+_FILE_HEADER = struct.Struct('<4sB')
+_NAME = struct.Struct('<BBH') # kind, name length, player id
+_GAME = struct.Struct('<BBBBHHHHII') # see the module docstring
+_NAME_RECORD, _GAME_RECORD = 1, 2
+_PREPEND = '<' # Ghost._PREPEND
+_READ_BUFFER = 1 << 20
+
+Record = collections.namedtuple(
+    'Record', 'players moves result winner latencies word start')
+
+# Internal functions
+def _varint(value):
+    ''' LEB128: 7 bits per byte, low bits first '''
+    out = []
+    while value >= 0x80:
+        out.append(chr(value & 0x7f | 0x80))
+        value >>= 7
+    out.append(chr(value))
+    return ''.join(out)
+
+def _read_varint(data, i):
+    ''' Returns the varint at data[i] and the index after it '''
+    value = shift = 0
+    while True:
+        byte = ord(data[i])
+        i += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+def _move_code(move):
+    if move == '!':
+        return 0
+    elif move[0] == _PREPEND:
+        return 27 + string.lowercase.index(move[1])
+    else:
+        return 1 + string.lowercase.index(move)
+
+def _move(code):
+    if code == 0:
+        return '!'
+    elif code > 26:
+        return _PREPEND + string.lowercase[code - 27]
+    else:
+        return string.lowercase[code - 1]
+
+def _apply_move(fragment, move):
+    ''' Ghost.superghost_move, which also covers plain Ghost moves '''
+    if move[0] == _PREPEND:
+        return move[1:] + fragment
+    else:
+        return fragment + move
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError
+    return data
+
+def _records(f, names):
+    ''' Yields the games in an open log, stopping at a cut short record.
+    names is filled with the player names by id.
+    '''
+    header = f.read(_FILE_HEADER.size)
+    if len(header) < _FILE_HEADER.size: # empty, or cut short in the header
+        return
+    magic, version = _FILE_HEADER.unpack(header)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError('not a version {0} game log'.format(_VERSION))
+    try:
+        while True:
+            kind = f.read(1)
+            if not kind:
+                return
+            if ord(kind) == _NAME_RECORD:
+                _, length, player = _NAME.unpack(
+                    kind + _read_exactly(f, _NAME.size - 1))
+                names[player] = _read_exactly(f, length)
+                continue
+            if ord(kind) != _GAME_RECORD:
+                raise ValueError('bad record kind {0}'.format(ord(kind)))
+            _, result, winner, _, first, second, num_moves, word_length, \
+                start, size = _GAME.unpack(
+                    kind + _read_exactly(f, _GAME.size - 1))
+            payload = _read_exactly(f, size)
+            moves = [_move(ord(c)) for c in payload[:num_moves]]
+            latencies = []
+            i = num_moves
+            for _ in xrange(num_moves):
+                microseconds, i = _read_varint(payload, i)
+                latencies.append(microseconds / 1e6)
+            yield Record((names[first], names[second]), moves, result,
+                         winner, latencies, payload[i:i + word_length],
+                         start)
+    except EOFError:
+        return
+
+# Public classes and functions
+class GameLog(object):
+    ''' Appends games to the log at path, creating it if need be '''
+    def __init__(self, path):
+        names = {}
+        end = 0 # of the last whole game
+        if os.path.exists(path) and \
+                os.path.getsize(path) >= _FILE_HEADER.size:
+            end = _FILE_HEADER.size
+            with open(path, 'rb', _READ_BUFFER) as f:
+                for _ in _records(f, names):
+                    end = f.tell()
+        self._ids = dict((name, id) for id, name in names.iteritems())
+        self._file = open(path, 'ab')
+        self._file.truncate(end)
+        if end == 0:
+            self._file.write(_FILE_HEADER.pack(_MAGIC, _VERSION))
+
+    def _player_id(self, name, new_names):
+        ''' Returns the id of name, adding a name record to new_names if
+        it is the first time the player is seen
+        '''
+        if name not in self._ids:
+            self._ids[name] = len(self._ids)
+            new_names.append(_NAME.pack(_NAME_RECORD, len(name[:255]),
+                                        self._ids[name]) + name[:255])
+        return self._ids[name]
+
+    def record(self, players, moves, result, winner, latencies=None,
+               word='', start=None):
+        ''' Appends a game. players are the names of the players in the
+        order they moved, moves is the sequence of moves (letters, '!' or
+        Superghost '<' letters), winner is the index in players of the
+        winner and latencies the seconds each move took.
+        '''
+        new_names = []
+        ids = [self._player_id(name, new_names) for name in players]
+        if latencies is None:
+            latencies = [0.0] * len(moves)
+        payload = ''.join(chr(_move_code(move)) for move in moves) + \
+            ''.join(_varint(int(seconds * 1e6)) for seconds in latencies) + \
+            word
+        header = _GAME.pack(_GAME_RECORD, result, winner, 0, ids[0], ids[1],
+                            len(moves), len(word),
+                            int(time.time() if start is None else start),
+                            len(payload))
+        self._file.write(''.join(new_names) + header + payload)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read(path):
+    ''' Yields every game in the log at path as a Record, reading it a
+    buffer at a time
+    '''
+    with open(path, 'rb', _READ_BUFFER) as f:
+        for record in _records(f, {}):
+            yield record
+
+class Analysis(object):
+    ''' Statistics gathered from a stream of Records:
+
+        games               number of games
+        results             games by result code
+        players             name -> [games, wins, moves, seconds moving]
+        fragments           fragment -> [games, wins]: the games that
+                            reached the fragment, and how many were won by
+                            the player who made it (up to max_depth moves)
+        openings            (fragment, move) -> [games, wins], the same
+                            for each move made from the fragment
+    '''
+    def __init__(self, max_depth=6):
+        self.max_depth = max_depth
+        self.games = 0
+        self.results = collections.Counter()
+        self.players = collections.defaultdict(lambda: [0, 0, 0, 0.0])
+        self.fragments = collections.defaultdict(lambda: [0, 0])
+        self.openings = collections.defaultdict(lambda: [0, 0])
+
+    def add(self, record):
+        self.games += 1
+        self.results[record.result] += 1
+        for i, name in enumerate(record.players):
+            stats = self.players[name]
+            stats[0] += 1
+            stats[1] += record.winner == i
+            stats[2] += len(record.moves[i::2])
+            stats[3] += sum(record.latencies[i::2])
+        fragment = ''
+        for i, move in enumerate(record.moves[:self.max_depth]):
+            if move == '!':
+                break
+            won = record.winner == i % 2
+            stats = self.openings[fragment, move]
+            stats[0] += 1
+            stats[1] += won
+            fragment = _apply_move(fragment, move)
+            stats = self.fragments[fragment]
+            stats[0] += 1
+            stats[1] += won
+        return self
+
+    def win_rates(self):
+        ''' name -> fraction of its games the player won '''
+        return dict((name, float(wins) / games)
+                    for name, (games, wins, _, _) in self.players.iteritems())
+
+    def opening_book(self, min_games=100):
+        ''' fragment -> (move, win rate, games): for every fragment short of
+        max_depth, the move that has won most often for the player making
+        it, out of moves played in at least min_games games
+        '''
+        book = {}
+        for (fragment, move), (games, wins) in self.openings.iteritems():
+            rate = float(wins) / games
+            if games >= min_games and (fragment not in book or
+                                       rate > book[fragment][1]):
+                book[fragment] = (move, rate, games)
+        return book
+
+def analyze(paths, max_depth=6):
+    ''' Returns the Analysis of the logs at paths, in one streaming pass '''
+    analysis = Analysis(max_depth)
+    for path in paths:
+        for record in read(path):
+            analysis.add(record)
+    return analysis
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print 'usage: python gamelog.py LOG [LOG...]'
+        sys.exit(1)
+    analysis = analyze(sys.argv[1:])
+    print '{0} games'.format(analysis.games)
+    for result, count in sorted(analysis.results.iteritems()):
+        print '  result {0}: {1}'.format(result, count)
+    for name, (games, wins, moves, seconds) in \
+            sorted(analysis.players.iteritems()):
+        print '{0}: {1:.1%} of {2} games won, {3:.0f}us per move'.format(
+            name, float(wins) / games, games, seconds / max(moves, 1) * 1e6)
+    book = analysis.opening_book()
+    for fragment in sorted(book, key=lambda f: (len(f), f))[:20]:
+        move, rate, games = book[fragment]
+        print "'{0}' -> {1} ({2:.1%} of {3} games)".format(
+            fragment, move, rate, games)
@@ -1,11 +1,17 @@
 '''
 Ghost.py
 Plays the game Ghost. Opponent can be either human or computer.
+Run `python ghost.py super` to play Superghost, where letters can also
+be added to the start of the fragment, and add `--log FILE` to record
+the games in a game log (see gamelog.py).
 '''
 
 import string
+import sys
+import timeit
+import gamelog
 import lexicon
-from ghostplayer import SimpleGhostPlayer
+from ghostplayer import SimpleGhostPlayer, SimpleSuperghostPlayer
 
 YES_STRINGS = ['', 'y', 'yes', 'yep', 'yea', 'ok', 'sure', 'okay']
 NO_STRINGS = ['n', 'no', 'nah', 'naw', 'nope', 'never']
@@ -17,6 +23,7 @@ class Ghost(object):
     _WON_CHALLENGE = 1 
     _LOST_CHALLENGE = 2
     _MIN_WORD_LENGTH = 3
+    _PREPEND = '<' # in Superghost, '<a' adds 'a' to the start
     _WELCOME_MESSAGE = '''Welcome to Ghost!
 You and your opponent will add letters to a growing word fragment
 Choose your letters carefully. The word fragment has to be the beginning
@@ -30,7 +37,13 @@ opponent is bluffing, type '!' to challenge them.
 Note: The game only checks for words that have 3 or more letters. The 
 Scrabble dictionary is littered with annoyingly obscure 2 words.
 '''
-    def __init__(self):
+    _SUPERGHOST_MESSAGE = '''This is Superghost! The fragment only has to
+appear somewhere inside a word. Type a letter to add it to the end of the
+fragment, or '<' and a letter (like '<a') to add it to the start.
+'''
+    def __init__(self, superghost=False, log=None):
+        self._superghost = superghost
+        self._log = log # a gamelog.GameLog, or None
         self._names = ['', '']
         self._wins = [0, 0]
         self._prev_winner = 0
@@ -48,11 +61,16 @@ Scrabble dictionary is littered with annoyingly obscure 2 words.
     def welcome(self):
         ''' Sets up the game: user names, play against computer, etc. '''
         print Ghost._WELCOME_MESSAGE        
+        if self._superghost:
+            print Ghost._SUPERGHOST_MESSAGE
         self._names[0] = raw_input('Player 1, choose your name: ').strip()
         self._play_computer = \
             self.yes_or_no('Play against a computer opponent? ')
         if self._play_computer:
-            self._computer = SimpleGhostPlayer()
+            if self._superghost:
+                self._computer = SimpleSuperghostPlayer()
+            else:
+                self._computer = SimpleGhostPlayer()
             self._names[1] = self._computer.get_name()
         else:
             self._names[1] = raw_input('Player 2, choose your name: ').strip()
@@ -63,28 +81,44 @@ Scrabble dictionary is littered with annoyingly obscure 2 words.
         print
         print '- Game {0} -'.format(self._games_played + 1)
         fragment = ''
+        position = lexicon.cursor() # follows fragment through the lexicon
         current, opponent = \
             self._prev_loser, self._prev_winner # loser goes first
+        first = current
+        moves, times, word = [], [], ''
         # play turns
         while True: 
+            start = timeit.default_timer()
             letter = self.get_next_letter(current, fragment)
+            times.append(timeit.default_timer() - start)
+            moves.append(letter)
             # just adding a letter
             if letter != '!':
-                fragment += letter
-                if lexicon.has_word(fragment, Ghost._MIN_WORD_LENGTH):
+                if self._superghost:
+                    fragment = Ghost.superghost_move(fragment, letter)
+                    formed_word = \
+                        lexicon.has_word(fragment, Ghost._MIN_WORD_LENGTH)
+                else:
+                    fragment += letter
+                    formed_word = \
+                        position.push(letter).has_word(Ghost._MIN_WORD_LENGTH)
+                if formed_word:
                     result = Ghost._FORMED_WORD
                     break
             # a challenge was issued
             else:
                 word = self.get_word(opponent, fragment)
-                if word[:len(fragment)] == fragment and lexicon.has_word(word):
-                    result = self.__class__._LOST_CHALLENGE
-                else:
-                    result = Ghost._WON_CHALLENGE
+                result = Ghost.challenge_result(fragment, word,
+                                                self._superghost)
                 break
             current, opponent = opponent, current
         self.process_result(current, opponent, fragment, result)
         self._games_played += 1
+        if self._log is not None:
+            self._log.record([self._names[first], self._names[1 - first]],
+                             moves, result, int(self._prev_winner != first),
+                             times, word)
+            self._log.flush()
 
     def get_next_letter(self, player, fragment):
         ''' Gets the next move from the current player '''
@@ -100,18 +134,54 @@ Scrabble dictionary is littered with annoyingly obscure 2 words.
             else:
                 letter = raw_input(prompt).strip()
             # validating the input
-            if letter == '!' and not fragment:
-                print '\tCannot challenge on the first turn'
-            elif len(letter) != 1 or (letter not in string.letters + '!'):
-                print "\tEnter a single letter or '!'"
+            error = Ghost.check_move(letter, fragment, self._superghost)
+            if error:
+                print '\t' + error
             else:
                 break
         return letter.lower() # the lexicon is all lowercase
 
+    @staticmethod
+    def check_move(letter, fragment, superghost=False):
+        ''' Returns why letter is not a legal move, or None if it is '''
+        # '<' only goes with a letter; '<!' is not a move
+        if superghost and len(letter) == 2 and letter[0] == Ghost._PREPEND \
+                and letter[1] in string.letters:
+            letter = letter[1]
+        if letter == '!' and not fragment:
+            return 'Cannot challenge on the first turn'
+        elif len(letter) != 1 or (letter not in string.letters + '!'):
+            return "Enter a single letter or '!'"
+        return None
+
+    @staticmethod
+    def superghost_move(fragment, letter):
+        ''' The fragment after a Superghost move (a letter or '<' letter) '''
+        if letter[0] == Ghost._PREPEND:
+            return letter[1:] + fragment
+        else:
+            return fragment + letter
+
+    @staticmethod
+    def challenge_result(fragment, word, superghost=False):
+        ''' Result for the challenger when word is offered for fragment '''
+        if superghost:
+            repelled = fragment in word and lexicon.has_word(word)
+        else:
+            repelled = word[:len(fragment)] == fragment and \
+                lexicon.has_word(word)
+        if repelled:
+            return Ghost._LOST_CHALLENGE
+        else:
+            return Ghost._WON_CHALLENGE
+
     def get_word(self, player, fragment):
         ''' Gets a word from a player who has been challenged '''
         print "\t{0}, you've been challenged!".format(self._names[player])
-        prompt = '\tEnter a word that begins with the current fragment: '
+        if self._superghost:
+            prompt = '\tEnter a word that contains the current fragment: '
+        else:
+            prompt = '\tEnter a word that begins with the current fragment: '
         if player == 1 and self._play_computer:
             word = self._computer.get_word(fragment)
             print prompt + word
@@ -155,5 +225,10 @@ Scrabble dictionary is littered with annoyingly obscure 2 words.
                                                self._wins[1], self._names[1])
 
 if __name__ == '__main__':
-    Ghost().play()
+    args = sys.argv[1:]
+    log = None
+    if '--log' in args:
+        log = gamelog.GameLog(args.pop(args.index('--log') + 1))
+        args.remove('--log')
+    Ghost(superghost=args == ['super'], log=log).play()
 
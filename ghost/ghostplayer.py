@@ -1,12 +1,18 @@
 ''' ghostplayer.py
 Defines an abstract class for computer Ghost players.
-Provides an implementation of a simple computer player
-at the moment.
+Provides a simple computer player, a perfect one that plays from a
+solved game table, a Monte Carlo one that bluffs, and a simple player for
+Superghost.
 '''
 
+import math
 import string
 import random
+import timeit
+from collections import OrderedDict
 import lexicon
+import solver
+import substrings
 
 class GhostPlayer(object):
     
@@ -26,20 +32,25 @@ class SimpleGhostPlayer(GhostPlayer):
 
     def __init__(self):
         self.name = 'COMPUTER'
+        self._position = lexicon.cursor() # follows the game's fragment
 
     def get_name(self):
         return self.name
 
     def get_next_letter(self, fragment):
-        # always challenge if fragment is not a prefix
-        if not lexicon.has_prefix(fragment):
+        position = self._position.seek(fragment)
+        # always challenge if fragment is not a prefix (or cannot grow,
+        # which happens to short words)
+        if not position.has_prefix() or not position.valid_continuations():
             return '!'
         # choose a random next letter
         else:
-            next_letter = random.choice(lexicon.valid_continuations(fragment))
+            next_letter = random.choice(position.valid_continuations())
             # if that next letter completes a word, challenge instead
             # for now, GhostPlayer does not know about Ghost._MIN_WORD_LENGTH
-            if lexicon.has_word(fragment + next_letter): 
+            forms_word = position.push(next_letter).has_word()
+            position.pop()
+            if forms_word:
                 return '!'
             # otherwise, just play that letter
             else:
@@ -47,9 +58,194 @@ class SimpleGhostPlayer(GhostPlayer):
                            
     def get_word(self, fragment):
         # return any word with fragment as a prefix
-        while not lexicon.has_word(fragment):
-            next_letter = random.choice(lexicon.valid_continuations(fragment))
-            fragment += next_letter
-        return fragment
+        position = self._position.seek(fragment)
+        if not position.has_prefix(): # caught bluffing
+            return fragment
+        return position.shortest_word()
+
+class PerfectGhostPlayer(SimpleGhostPlayer):
+    ''' Plays from a solved game table (see solver.py): a winning letter
+    whenever there is one, otherwise the letter that loses slowest.
+    '''
+    _solutions = {} # shared by all instances, keyed by min_word_length
+                    # and the signature of the Dawg solved
+
+    def __init__(self, min_word_length=3): # Ghost._MIN_WORD_LENGTH
+        # freeze first, so the cursor walks the same Dawg as the solution
+        dawg = lexicon.freeze()
+        SimpleGhostPlayer.__init__(self)
+        key = (min_word_length, solver._signature(dawg))
+        if key not in self._solutions:
+            self._solutions[key] = solver.load_or_solve(dawg, min_word_length)
+        self._solution = self._solutions[key]
+
+    def get_next_letter(self, fragment):
+        position = self._position.seek(fragment)
+        # always challenge if fragment is not a prefix
+        if not position.has_prefix():
+            return '!'
+        letter = self._solution.best_move(position.node(), len(fragment))
+        # every real continuation loses on the spot, so bluff instead
+        if letter is None:
+            continuations = position.valid_continuations()
+            letter = random.choice([letter for letter in string.lowercase
+                                    if letter not in continuations])
+        return letter
+
+class _LRUCache(object):
+    ''' A dict that forgets the least recently used keys beyond maxsize '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
 
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value # now the most recently used
+        return value
+
+    def put(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+class MonteCarloGhostPlayer(SimpleGhostPlayer):
+    ''' Chooses letters by random playouts over the lexicon, and bluffs
+    (plays a letter that is no longer a prefix) when the opponent seems
+    unlikely to challenge and the honest letters look bad.
+
+    Playout statistics are kept per fragment in an LRU cache, so they are
+    reused across turns and games. Each move takes about time_budget_ms.
+    It challenges exactly when the fragment is not a prefix: knowing the
+    whole lexicon, that challenge always wins and any other always loses.
+    '''
+    def __init__(self, time_budget_ms=20, cache_size=100000,
+                 min_word_length=3): # Ghost._MIN_WORD_LENGTH
+        SimpleGhostPlayer.__init__(self)
+        self.time_budget_ms = time_budget_ms
+        self._min_word_length = min_word_length
+        self._graph = lexicon.graph()
+        self._stats = _LRUCache(cache_size) # fragment -> [wins, playouts]
+        self._bluffs = [0, 0] # bluffs the opponent [called, let go]
+        self._last_bluff = None
+
+    def get_next_letter(self, fragment):
+        self._notice_bluff_let_go(fragment)
+        position = self._position.seek(fragment)
+        # always challenge if fragment is not a prefix (or cannot grow)
+        if not position.has_prefix() or not position.valid_continuations():
+            return '!'
+        deadline = timeit.default_timer() + self.time_budget_ms / 1000.0
+        candidates = self._candidates(position)
+        # spread playouts between the candidates (UCB1) until time is up
+        playouts = 0
+        while candidates and (playouts < len(candidates) or
+                              timeit.default_timer() < deadline):
+            playouts += 1
+            letter, node = max(candidates, key=lambda candidate:
+                               self._priority(fragment + candidate[0],
+                                              playouts))
+            opponent_wins = self._playout(node, len(fragment) + 1)
+            self._record(fragment + letter, opponent_wins)
+        best, best_value = None, -1.0
+        for letter, node in candidates:
+            wins, total = self._stats.get(fragment + letter, (0, 0))
+            value = 1.0 - float(wins) / total if total else 0.0
+            if value > best_value:
+                best, best_value = letter, value
+        # an unchallenged bluff wins: we challenge on the next turn
+        called, let_go = self._bluffs
+        bluff_value = (let_go + 1.0) / (called + let_go + 2)
+        continuations = position.valid_continuations()
+        bluffs = [letter for letter in string.lowercase
+                  if letter not in continuations]
+        if bluffs and bluff_value > best_value:
+            best = random.choice(bluffs)
+            self._last_bluff = fragment + best
+        # every letter forms a word: nothing left but to lose
+        return best or continuations[0]
+
+    def get_word(self, fragment):
+        if fragment == self._last_bluff:
+            self._bluffs[0] += 1 # called
+            self._last_bluff = None
+        return SimpleGhostPlayer.get_word(self, fragment)
+
+    def _notice_bluff_let_go(self, fragment):
+        if self._last_bluff is not None:
+            if len(fragment) > len(self._last_bluff) and \
+                    fragment.startswith(self._last_bluff):
+                self._bluffs[1] += 1
+            self._last_bluff = None
+
+    def _candidates(self, position):
+        ''' Continuations that do not form a word, as (letter, node) '''
+        forms_words = len(position) + 1 >= self._min_word_length
+        return [(letter, node) for letter, node
+                in self._graph.children(position.node())
+                if not (forms_words and self._graph.is_word(node))]
+
+    def _priority(self, fragment, playouts):
+        wins, total = self._stats.get(fragment, (0, 0))
+        if not total:
+            return float('inf')
+        return 1.0 - float(wins) / total + \
+            math.sqrt(2 * math.log(playouts) / total)
+
+    def _record(self, fragment, wins):
+        stats = self._stats.get(fragment, (0, 0))
+        self._stats.put(fragment, (stats[0] + wins, stats[1] + 1))
+
+    def _playout(self, node, depth):
+        ''' Plays randomly (never forming a word when it can be avoided)
+        from node. Returns 1 if the player to move there wins, else 0.
+        '''
+        graph = self._graph
+        mover = 0
+        while True:
+            forms_words = depth + 1 >= self._min_word_length
+            moves = [child for letter, child in graph.children(node)
+                     if not (forms_words and graph.is_word(child))]
+            if not moves: # form a word, or bluff and be challenged
+                return mover # 1 when the opponent is the one stuck
+            node = random.choice(moves)
+            depth += 1
+            mover = 1 - mover
+
+class SimpleSuperghostPlayer(GhostPlayer):
+    ''' Plays Superghost: a random letter at either end of the fragment
+    that keeps it inside some word, without making a word
+    '''
+    def __init__(self, min_word_length=3): # Ghost._MIN_WORD_LENGTH
+        self.name = 'COMPUTER'
+        self._min_word_length = min_word_length
+
+    def get_name(self):
+        return self.name
+
+    def get_next_letter(self, fragment):
+        after = substrings.right_extensions(fragment)
+        # always challenge if fragment is not inside a word
+        if after is None:
+            return '!'
+        before = substrings.left_extensions(fragment)
+        # '<' adds a letter to the start, like Ghost._PREPEND
+        moves = [letter for letter in after if not lexicon.has_word(
+                     fragment + letter, self._min_word_length)] + \
+                ['<' + letter for letter in before if not lexicon.has_word(
+                     letter + fragment, self._min_word_length)]
+        # if every move completes a word, challenge instead
+        if not moves:
+            return '!'
+        return random.choice(moves)
+
+    def get_word(self, fragment):
+        # return any word that contains fragment (caught bluffing if none)
+        return substrings.word_containing(fragment) or fragment
 
@@ -1,12 +1,40 @@
 ''' Lexicon.py
-Efficiently supports checking if a string is a valid English prefix 
-or word. The lexicon is backed by a trie data structure.
+Efficiently supports checking if a string is a valid English prefix
+or word. The lexicon is backed by a minimized DAWG stored in flat arrays
+(see dawg.py). The original dict-based trie is kept as the 'trie' backend.
+
+The lexicon is loaded on the first query. Run `python lexicon.py compile`
+to write COMPILED_FILE; it is then memory-mapped instead of rebuilding the
+DAWG from WORDS_FILE, which is still used whenever the compiled file is
+missing or out of date with the words file.
+
+Words can be added and removed while running (add_word(), remove_word()).
+The DAWG is then thawed into a MutableDawg that stays minimal as it is
+edited, and save_delta() writes the edits to DELTA_FILE, along with the
+edited DAWG to MERGED_FILE. The next time the lexicon is loaded, MERGED_FILE
+is memory-mapped if it was made from the same base lexicon and delta;
+otherwise the delta is applied to the base (slow) and MERGED_FILE rewritten.
+
+To fan out across processes, build the lexicon once and share() it:
+forked children then read the parent's copy, and other processes can
+attach() to it, read-only and without copying.
 '''
 
+import hashlib
+import os
 import sys
 import string
+from dawg import Dawg, MutableDawg
+try:
+    import numpy as np
+except ImportError:
+    np = None # the *_many functions fall back to one query at a time
 
 WORDS_FILE = 'TWL_2006_ALPHA.txt' # from Scrabble.com
+COMPILED_FILE = 'TWL_2006_ALPHA.dawg'
+DELTA_FILE = 'TWL_2006_ALPHA.delta'
+MERGED_FILE = 'TWL_2006_ALPHA.merged.dawg' # the base lexicon plus the delta
+BACKEND = 'dawg' # 'dawg' or 'trie'
 
 # Internal classes and functions
 class _Node(object):
@@ -15,7 +43,7 @@ class _Node(object):
         self.letter = letter
         self.next = {}
         self.eow = False # end of word marker
-       
+
     def next_letters(self):
         return self.next.keys()
 
@@ -31,9 +59,64 @@ class _Node(object):
         for letter, node in self.next.iteritems():
             node.debug_full(depth + 1)
 
-def _insert_word(word):
-    if word:
-        _insert_word_rec(word, _dawg)
+class _Trie(object):
+    ''' Gives the _Node trie the same interface as dawg.Dawg '''
+    def __init__(self, words=()):
+        self.root = _Node(None) # the root node (it has no letter)
+        for word in words:
+            self.insert(word)
+        self.annotate()
+
+    def insert(self, word):
+        ''' Adds a word. Call annotate() once done inserting. '''
+        if word:
+            _insert_word_rec(word, self.root)
+
+    def annotate(self):
+        _annotate_rec(self.root)
+
+    def word_count(self, node):
+        return node.count
+
+    def depth_range(self, node):
+        return node.min_depth, node.max_depth
+
+    def shortest_word(self, node, prefix=''):
+        letters = [prefix]
+        while node.shortest:
+            letters.append(node.shortest)
+            node = node.next[node.shortest]
+        return ''.join(letters)
+
+    def child(self, node, letter):
+        return node.next.get(letter)
+
+    def is_word(self, node):
+        return node.eow
+
+    def letters(self, node):
+        return node.next_letters()
+
+    def children(self, node):
+        return node.next.items()
+
+    def traverse(self, str, node=None):
+        return _traverse_rec(str, self.root if node is None else node)
+
+    def words(self):
+        ''' Yields every word in sorted order '''
+        stack = [(self.root, '')]
+        while stack:
+            node, prefix = stack.pop()
+            if node.eow:
+                yield prefix
+            for letter in sorted(node.next, reverse=True):
+                stack.append((node.next[letter], prefix + letter))
+
+    def debug_full(self):
+        self.root.debug_full()
+
+_BACKENDS = {'dawg': Dawg.from_words, 'trie': _Trie}
 
 def _insert_word_rec(word, node):
     if not word:
@@ -42,9 +125,26 @@ def _insert_word_rec(word, node):
     next_node = node.next.setdefault(word[0], _Node(word[0]))
     _insert_word_rec(word[1:], next_node)
 
+def _annotate_rec(node):
+    ''' Sets count, min_depth, max_depth and shortest (the letter towards
+    the shortest word) on node and everything below it
+    '''
+    node.count = int(node.eow)
+    node.min_depth = 0 if node.eow else None
+    node.max_depth = 0
+    node.shortest = None
+    for letter in sorted(node.next):
+        child = node.next[letter]
+        _annotate_rec(child)
+        node.count += child.count
+        node.max_depth = max(node.max_depth, child.max_depth + 1)
+        if node.min_depth is None or child.min_depth + 1 < node.min_depth:
+            node.min_depth, node.shortest = child.min_depth + 1, letter
+    node.min_depth = node.min_depth or 0 # None only for an empty lexicon
+
 def _traverse(str):
     ''' Returns the node corresponding to the last letter in string str '''
-    return _traverse_rec(str, _dawg)
+    return _get_lexicon().traverse(str)
 
 def _traverse_rec(str, node):
     if not str:
@@ -54,52 +154,398 @@ def _traverse_rec(str, node):
     else:
         return None
 
-# Initialization script
-_dawg = _Node(None) # the root node (it has no letter)
-lines_read = 0 
-sys.stdout.write('loading lexicon')
-sys.stdout.flush()
-try:
-    f = open(WORDS_FILE)
-    for line in f:
-        _insert_word(line.strip().lower()) # words are coerced to lowercase
-        lines_read += 1
-        if lines_read % 25000 == 0: 
-            sys.stdout.write('.')
-            sys.stdout.flush()
-except IOError as e:
-    print 'Error opening the file'
-else:
-    f.close()
+def _read_words(path):
+    ''' Yields the words in a words file, printing progress dots '''
+    lines_read = 0
+    sys.stdout.write('loading lexicon')
+    sys.stdout.flush()
+    try:
+        f = open(path)
+    except IOError as e:
+        print 'Error opening the file'
+        return
+    with f:
+        for line in f:
+            yield line.strip().lower() # words are coerced to lowercase
+            lines_read += 1
+            if lines_read % 25000 == 0:
+                sys.stdout.write('.')
+                sys.stdout.flush()
     print '{0} words added\n'.format(lines_read)
 
+def _build(words, backend=BACKEND):
+    return _BACKENDS[backend](words)
+
+def _source_stamp(path):
+    ''' The (size, mtime) a compiled lexicon records for its words file '''
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+def _compiled_is_fresh(compiled_file, words_file):
+    stamp = Dawg.header(compiled_file)
+    if stamp is None:
+        return False
+    try:
+        return stamp == _source_stamp(words_file)
+    except OSError:
+        return True # no words file to be stale against
+
+def _read_delta(path, base):
+    ''' Returns the edits in a delta file as a dict of word -> True (added)
+    or False (removed), or {} if there is none for this base lexicon
+    '''
+    try:
+        f = open(path)
+    except IOError:
+        return {}
+    with f:
+        if f.readline().split() != ['dawg-delta', str(base.checksum())]:
+            return {} # written against another base
+        return dict((line[1:].strip(), line[0] == '+') for line in f
+                    if line[:1] in ('+', '-'))
+
+def _apply(dawg, delta):
+    ''' Returns dawg with the edits in delta made to it '''
+    if not delta:
+        return dawg
+    mutable = MutableDawg(dawg)
+    for word, added in delta.iteritems():
+        if added:
+            mutable.add_word(word)
+        else:
+            mutable.remove_word(word)
+    return mutable.freeze()
+
+def _merged_stamp(base_checksum, delta):
+    ''' Identifies a base lexicon and delta in the header of MERGED_FILE,
+    in place of the words file's (size, mtime)
+    '''
+    lines = [str(base_checksum)] + ['{0}{1}'.format('+' if delta[word]
+                                                     else '-', word)
+                                    for word in sorted(delta)]
+    return int(hashlib.sha1('\n'.join(lines)).hexdigest()[:16], 16), 0.0
+
+def _save_merged(dawg, stamp, path=MERGED_FILE):
+    ''' Saves dawg under a temporary name and renames it into place, so
+    that a process loading it never sees half a file
+    '''
+    try:
+        dawg.save(path + '.tmp', stamp)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError):
+        print 'Error writing the edited lexicon.'
+
+def _load(backend=BACKEND):
+    global _base_checksum, _delta
+    if backend != 'dawg':
+        return _build(_read_words(WORDS_FILE), backend)
+    if _compiled_is_fresh(COMPILED_FILE, WORDS_FILE):
+        base = Dawg.load(COMPILED_FILE)
+    else:
+        base = _build(_read_words(WORDS_FILE), backend)
+    _base_checksum = base.checksum()
+    _delta = _read_delta(DELTA_FILE, base)
+    if not _delta:
+        return base
+    stamp = _merged_stamp(_base_checksum, _delta)
+    if Dawg.header(MERGED_FILE) == stamp:
+        return Dawg.load(MERGED_FILE)
+    merged = _apply(base, _delta)
+    _save_merged(merged, stamp)
+    return merged
+
+def _get_lexicon():
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = _load()
+    return _lexicon
+
+def _get_sorted_words():
+    ''' All words as a sorted NumPy string array, for the *_many queries '''
+    global _sorted_words
+    if _sorted_words is None:
+        _sorted_words = np.array(list(_get_lexicon().words()))
+    return _sorted_words
+
+def _get_mutable():
+    ''' Thaws the lexicon for editing, if it is not already '''
+    global _lexicon
+    lexicon = _get_lexicon()
+    if isinstance(lexicon, Dawg):
+        _lexicon = MutableDawg(lexicon)
+    elif not isinstance(lexicon, MutableDawg):
+        raise TypeError('only the dawg backend can be edited')
+    return _lexicon
+
+def _edit(word, add):
+    ''' Adds or removes word, keeping track of the delta from the base '''
+    global _sorted_words
+    word = word.strip().lower()
+    lexicon = _get_mutable()
+    changed = lexicon.add_word(word) if add else lexicon.remove_word(word)
+    if changed:
+        _sorted_words = None
+        # the edit either undoes an earlier one or moves away from the base
+        if word in _delta:
+            del _delta[word]
+        else:
+            _delta[word] = add
+    return changed
+
+def _as_queries(strings):
+    ''' Returns the queries cut to the width of the sorted word array,
+    and a mask of the queries that were too long to fit (and so can be
+    neither words nor prefixes)
+    '''
+    words = _get_sorted_words()
+    queries = np.asarray(strings if isinstance(strings, np.ndarray)
+                         else list(strings), dtype=str)
+    lengths = np.char.str_len(queries)
+    return queries.astype(words.dtype), lengths, \
+        lengths > words.dtype.itemsize
+
+_lexicon = None # loaded on first use
+_sorted_words = None # built on first batch query
+_base_checksum = None # of the lexicon before any edits
+_delta = {} # word -> True if added to the base lexicon, False if removed
+
 # Public functions
 def has_prefix(prefix):
-    return bool(_traverse(prefix))
+    return _traverse(prefix) is not None
 
 def has_word(word, min_length=0):
     last_node = _traverse(word)
-    return bool(last_node) and last_node.eow and len(word) >= min_length
+    return last_node is not None and _lexicon.is_word(last_node) and \
+        len(word) >= min_length
 
 def valid_continuations(prefix):
     node = _traverse(prefix)
-    if node:
-        return node.next_letters()
-    else: 
+    if node is not None:
+        return _lexicon.letters(node)
+    else:
+        return None
+
+def has_word_many(words, min_length=0):
+    ''' has_word for every string in words, returned as a boolean array '''
+    if np is None:
+        return [has_word(word, min_length) for word in words]
+    lexicon_words = _get_sorted_words()
+    queries, lengths, too_long = _as_queries(words)
+    if not lexicon_words.size:
+        return np.zeros(queries.shape, dtype=bool)
+    i = np.searchsorted(lexicon_words, queries)
+    i = np.minimum(i, lexicon_words.size - 1)
+    return (lexicon_words[i] == queries) & (lengths >= min_length) & \
+        ~too_long
+
+def has_prefix_many(prefixes):
+    ''' has_prefix for every string in prefixes, as a boolean array '''
+    if np is None:
+        return [has_prefix(prefix) for prefix in prefixes]
+    lexicon_words = _get_sorted_words()
+    queries, lengths, too_long = _as_queries(prefixes)
+    if not lexicon_words.size:
+        return lengths == 0
+    # the first word >= a prefix starts with it, if any word does
+    i = np.searchsorted(lexicon_words, queries)
+    i = np.minimum(i, lexicon_words.size - 1)
+    return np.char.startswith(lexicon_words[i], queries) & ~too_long
+
+def continuations_many(prefixes):
+    ''' valid_continuations for every string in prefixes, as a list '''
+    position = Cursor()
+    return [position.seek(prefix).valid_continuations()
+            for prefix in prefixes]
+
+def count_words(prefix):
+    ''' Number of words that start with prefix '''
+    node = _traverse(prefix)
+    return _lexicon.word_count(node) if node is not None else 0
+
+def depth_range(prefix):
+    ''' Fewest and most letters to add to prefix to make a word, or None '''
+    node = _traverse(prefix)
+    return _lexicon.depth_range(node) if node is not None else None
+
+def shortest_word(prefix):
+    ''' The shortest word that starts with prefix, or None '''
+    node = _traverse(prefix)
+    if node is not None:
+        return _lexicon.shortest_word(node, prefix)
+    else:
         return None
 
+def add_word(word):
+    ''' Adds word to the lexicon. Returns False if it was already there. '''
+    return _edit(word, True)
+
+def remove_word(word):
+    ''' Removes word from the lexicon. Returns False if it was not there. '''
+    return _edit(word, False)
+
+def save_delta(path=DELTA_FILE, merged_path=MERGED_FILE):
+    ''' Writes the words added and removed since the lexicon was loaded
+    from WORDS_FILE or COMPILED_FILE, to be applied when it is next loaded,
+    and the edited lexicon to merged_path, to be mapped instead
+    '''
+    lexicon = _get_lexicon()
+    with open(path, 'w') as f:
+        f.write('dawg-delta {0}\n'.format(_base_checksum))
+        for word in sorted(_delta):
+            f.write('{0}{1}\n'.format('+' if _delta[word] else '-', word))
+    if _delta:
+        # frozen without replacing the lexicon, so edits can go on as is
+        if isinstance(lexicon, MutableDawg):
+            lexicon = lexicon.freeze()
+        _save_merged(lexicon, _merged_stamp(_base_checksum, _delta),
+                     merged_path)
+
+def freeze():
+    ''' Turns an edited lexicon back into a flat Dawg, which is faster to
+    query and needed by share() and the solver. Cursors made before an edit
+    or a freeze() keep seeing the lexicon as it was.
+    '''
+    global _lexicon
+    if isinstance(_get_lexicon(), MutableDawg):
+        _lexicon = _lexicon.freeze()
+    return _lexicon
+
+def share(path=None):
+    ''' Moves the loaded lexicon into memory that other processes can read
+    without copying. With no path it goes into an anonymous shared mapping
+    that processes forked afterwards inherit. Otherwise it is written to
+    path (e.g. under /dev/shm) for any process to attach() to.
+    '''
+    global _lexicon
+    dawg = freeze()
+    if not isinstance(dawg, Dawg):
+        raise TypeError('only the dawg backend can be shared')
+    if path is None:
+        _lexicon = dawg.share()
+    else:
+        dawg.save(path)
+        _lexicon = Dawg.load(path)
+
+def attach(path):
+    ''' Uses the lexicon that another process share()d at path '''
+    global _lexicon
+    _lexicon = Dawg.load(path)
+
+def graph():
+    ''' Returns the loaded DAWG (or trie) behind the lexicon '''
+    return _get_lexicon()
+
+def cursor(fragment=''):
+    ''' Returns a Cursor positioned at fragment '''
+    return Cursor().seek(fragment)
+
+class Cursor(object):
+    ''' Walks the lexicon one letter at a time, remembering the node it is
+    on, so that push(), pop() and the queries below are all O(1).
+    '''
+    def __init__(self):
+        self._lexicon = _get_lexicon()
+        self._nodes = [self._lexicon.root]
+        self._letters = []
+
+    def __len__(self):
+        return len(self._letters)
+
+    def fragment(self):
+        return ''.join(self._letters)
+
+    def push(self, letter):
+        ''' Appends letter. The cursor may walk off the lexicon; it then
+        stays off it until enough letters are popped.
+        '''
+        node = self._nodes[-1]
+        if node is not None:
+            node = self._lexicon.child(node, letter)
+        self._nodes.append(node)
+        self._letters.append(letter)
+        return self
+
+    def pop(self):
+        ''' Removes and returns the last letter '''
+        self._nodes.pop()
+        return self._letters.pop()
+
+    def seek(self, fragment):
+        ''' Moves to fragment, reusing the common prefix with the current
+        fragment (so following a growing fragment costs one push per turn)
+        '''
+        common = 0
+        for a, b in zip(self._letters, fragment):
+            if a != b:
+                break
+            common += 1
+        while len(self._letters) > common:
+            self.pop()
+        for letter in fragment[common:]:
+            self.push(letter)
+        return self
+
+    def node(self):
+        ''' The current node in graph(), or None if off the lexicon '''
+        return self._nodes[-1]
+
+    def has_prefix(self):
+        return self._nodes[-1] is not None
+
+    def has_word(self, min_length=0):
+        node = self._nodes[-1]
+        return node is not None and self._lexicon.is_word(node) and \
+            len(self._letters) >= min_length
+
+    def valid_continuations(self):
+        node = self._nodes[-1]
+        if node is not None:
+            return self._lexicon.letters(node)
+        else:
+            return None
+
+    def count_words(self):
+        node = self._nodes[-1]
+        return self._lexicon.word_count(node) if node is not None else 0
+
+    def depth_range(self):
+        node = self._nodes[-1]
+        if node is not None:
+            return self._lexicon.depth_range(node)
+        else:
+            return None
+
+    def shortest_word(self):
+        node = self._nodes[-1]
+        if node is not None:
+            return self._lexicon.shortest_word(node, self.fragment())
+        else:
+            return None
+
+def compile(words_file=WORDS_FILE, compiled_file=COMPILED_FILE):
+    ''' Builds the DAWG from words_file and saves it to compiled_file '''
+    dawg = _build(_read_words(words_file), 'dawg')
+    dawg.save(compiled_file, _source_stamp(words_file))
+    return dawg
+
 # Sanity checks
-if __name__ == '__main__':
-    _insert_word('hi')
-    _insert_word('hat')
-    _insert_word('hit')
-    _insert_word('hop')
-    _insert_word('hopefulness')
-    _dawg.debug_full()
+if __name__ == '__main__' and sys.argv[1:] == ['compile']:
+    compile()
+elif __name__ == '__main__':
+    _lexicon = _build(['hi', 'hat', 'hit', 'hop', 'hopefulness'])
+    _lexicon.debug_full()
     print has_prefix('h')            # true
     print has_prefix('it')           # false
     print has_prefix('hopefuln')     # true
     print has_word('hopefuln')       # false
     print has_word('hopefulness')    # true
-    print valid_continuations('h')   # ['i', 'a', 'o']
+    print valid_continuations('h')   # ['a', 'i', 'o']
     print valid_continuations('haz') # None
+    print count_words('h')           # 5
+    print depth_range('ho')          # (1, 9)
+    print shortest_word('h')         # 'hi'
+    _lexicon = _build(['hi', 'hat', 'hit', 'hop', 'hopefulness'], 'dawg')
+    print add_word('hope')           # True
+    print remove_word('hat')         # True
+    print valid_continuations('h')   # ['i', 'o']
+    print shortest_word('hop')       # 'hop'
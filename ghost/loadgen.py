@@ -0,0 +1,94 @@
+''' loadgen.py
+Load generator for server.py. Opens many connections to a running server
+and keeps every one of them playing games, either as a random human
+player or by asking for computer vs computer games, then reports games
+and moves per second (in human mode, the moves the clients sent). It
+needs no lexicon of its own.
+
+    python loadgen.py [CONNECTIONS] [SECONDS] [human|bots] [PORT]
+'''
+
+import asynchat
+import asyncore
+import random
+import socket
+import string
+import sys
+import timeit
+import server
+
+class _Client(asynchat.async_chat):
+    ''' Plays games back to back over one connection '''
+    def __init__(self, port, mode, stats):
+        asynchat.async_chat.__init__(self)
+        self.set_terminator('\n')
+        self._mode = mode
+        self._stats = stats
+        self._incoming = []
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect(('localhost', port))
+
+    def handle_connect(self):
+        self._new_game()
+
+    def collect_incoming_data(self, data):
+        self._incoming.append(data)
+
+    def found_terminator(self):
+        fields = ''.join(self._incoming).split()
+        self._incoming = []
+        reply = fields[0] if fields else 'ERROR'
+        fragment = fields[-1] if len(fields) > 1 else ''
+        if reply == 'RESULT':
+            self._stats['games'] += 1
+            if self._mode == 'bots': # every letter, and any final '!'
+                self._stats['moves'] += len(fields[3]) + (fields[2] != '0')
+            self._new_game()
+        elif reply == 'CHALLENGED':
+            self.push('word {0}\n'.format(fragment)) # a bluff at best
+        elif reply == 'FRAGMENT':
+            self._play(fragment)
+        else:
+            self._stats['errors'] += 1
+            self._new_game()
+
+    def _new_game(self):
+        if self._stats['stopping']:
+            self.close()
+        else:
+            self.push('new bots\n' if self._mode == 'bots' else 'new\n')
+
+    def _play(self, fragment):
+        ''' A random human, challenging now and then '''
+        self._stats['moves'] += 1
+        if fragment and random.random() < 0.1:
+            self.push('!\n')
+        else:
+            self.push(random.choice(string.lowercase) + '\n')
+
+def run(connections=1000, seconds=10.0, mode='human', port=server.PORT):
+    ''' Returns a dict of games, moves and errors, and their rates '''
+    stats = {'games': 0, 'moves': 0, 'errors': 0, 'stopping': False}
+    for _ in range(connections):
+        _Client(port, mode, stats)
+    start = timeit.default_timer()
+    while asyncore.socket_map and \
+            timeit.default_timer() - start < seconds:
+        asyncore.loop(timeout=0.1, use_poll=True, count=1)
+    elapsed = timeit.default_timer() - start
+    stats['stopping'] = True
+    asyncore.close_all()
+    return {'connections': connections, 'seconds': elapsed,
+            'games': stats['games'], 'moves': stats['moves'],
+            'errors': stats['errors'],
+            'games_per_second': stats['games'] / elapsed,
+            'moves_per_second': stats['moves'] / elapsed}
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    report = run(int(args[0]) if len(args) > 0 else 1000,
+                 float(args[1]) if len(args) > 1 else 10.0,
+                 args[2] if len(args) > 2 else 'human',
+                 int(args[3]) if len(args) > 3 else server.PORT)
+    for key in sorted(report):
+        print '{0}: {1}'.format(key, report[key])
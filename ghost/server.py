@@ -0,0 +1,153 @@
+''' server.py
+Hosts many simultaneous games of Ghost over line-based TCP in a single
+process. Every session shares the one loaded lexicon, and each move is a
+single engine.Game step. Python 2 has no asyncio, so the event loop is
+asyncore's, polling so it is not limited to select()'s 1024 sockets.
+
+Each line a client sends is one command, and gets one line back:
+
+    new             start a game against the computer, you move first
+    new bots        play a whole computer vs computer game
+    <letter> or !   your move
+    word <word>     your word, after the computer challenged you
+    quit            close the connection
+
+    FRAGMENT <fragment>          your turn (after the computer's move)
+    CHALLENGED <fragment>        the computer challenged you, send a word
+    RESULT <WON|LOST> <code> <fragment>
+                                 the game is over (code is a Ghost result)
+    ERROR <message>
+
+Run it with `python server.py [PORT] [SimpleGhostPlayer|PerfectGhostPlayer]`
+and load it with loadgen.py. Each session has players of its own, so
+their lexicon cursors follow just that session's game. Only players that
+keep no state between games and move in constant time can be served:
+anything slower would hold up every other session.
+'''
+
+import asynchat
+import asyncore
+import socket
+import sys
+import engine
+import ghostplayer
+import lexicon
+from ghost import Ghost
+
+PORT = 7070
+PLAYERS = ('SimpleGhostPlayer', 'PerfectGhostPlayer') # fast and stateless
+
+class _Session(asynchat.async_chat):
+    ''' One client connection, playing one game at a time '''
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock)
+        self.set_terminator('\n')
+        self._server = server
+        self._incoming = []
+        self._game = None
+        self._computer = server.player()
+        self._bots = None # two more players, made for the first bots game
+
+    def collect_incoming_data(self, data):
+        self._incoming.append(data)
+
+    def found_terminator(self):
+        line = ''.join(self._incoming).strip()
+        self._incoming = []
+        command, _, argument = line.partition(' ')
+        try:
+            if command == 'new' and argument == 'bots':
+                self._play_bots()
+            elif command == 'new':
+                self._game = engine.Game()
+                self._reply('FRAGMENT')
+            elif command == 'word' and self._game:
+                self._game.answer(argument)
+                self._reply_result()
+            elif command == 'quit':
+                self.close_when_done()
+            elif self._game and len(line) == 1:
+                self._play_human(line)
+            else:
+                self._reply('ERROR', 'Unknown command')
+        except ValueError as e:
+            self._reply('ERROR', str(e))
+
+    def _play_human(self, letter):
+        ''' The human (player 0) moves, then the computer (player 1) '''
+        game = self._game
+        game.move(letter)
+        self._server.moves += 1
+        if game.challenged:
+            game.answer(self._computer.get_word(game.fragment))
+        else:
+            self._play_computer()
+        if game.over():
+            self._reply_result()
+        elif game.challenged:
+            self._reply('CHALLENGED', game.fragment)
+        else:
+            self._reply('FRAGMENT', game.fragment)
+
+    def _play_computer(self):
+        game = self._game
+        if game.over():
+            return
+        game.move(engine.get_next_letter(self._computer, game.fragment))
+        self._server.moves += 1
+
+    def _play_bots(self):
+        if self._bots is None:
+            self._bots = (self._server.player(), self._server.player())
+        winner, result, fragment = engine.play_game(self._bots)
+        self._server.moves += len(fragment) + \
+            (result != Ghost._FORMED_WORD) # the final '!'
+        self._server.games += 1
+        self._reply('RESULT', 'WON' if winner == 0 else 'LOST', result,
+                    fragment)
+
+    def _reply_result(self):
+        game = self._game
+        self._game = None
+        self._server.games += 1
+        self._reply('RESULT', 'WON' if game.winner == 0 else 'LOST',
+                    game.result, game.fragment)
+
+    def _reply(self, *fields):
+        self.push(' '.join(str(field) for field in fields) + '\n')
+
+class GhostServer(asyncore.dispatcher):
+    ''' Accepts connections and counts the games and moves played. Each
+    session gets its own players, made by calling player.
+    '''
+    def __init__(self, port=PORT, player=ghostplayer.SimpleGhostPlayer,
+                 backlog=1024):
+        asyncore.dispatcher.__init__(self)
+        lexicon.graph() # load once, before any session needs it
+        self.player = player
+        player() # so any solving happens before the first connection
+        self.games = 0
+        self.moves = 0
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(('localhost', port))
+        self.listen(backlog)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            sock, address = pair
+            _Session(sock, self)
+
+def serve(port=PORT, player=ghostplayer.SimpleGhostPlayer):
+    GhostServer(port, player)
+    asyncore.loop(use_poll=True)
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    name = sys.argv[2] if len(sys.argv) > 2 else 'SimpleGhostPlayer'
+    if name not in PLAYERS:
+        print 'the server can only run {0}'.format(' or '.join(PLAYERS))
+        sys.exit(1)
+    print 'serving Ghost on port {0}'.format(port)
+    serve(port, getattr(ghostplayer, name))
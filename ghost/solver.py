@@ -0,0 +1,145 @@
+''' solver.py
+Solves Ghost over the lexicon DAWG. Every game state gets a byte holding
+whether the player to move can force a win and how many more turns the
+game lasts under perfect play (winners finish fast, losers hold out),
+and a byte holding the letter to play, so moving is a table lookup.
+
+A state is a DAWG node plus the fragment length, capped at the minimum
+word length: once a fragment is that long, every word formed ends the game,
+so deeper states only depend on the node.
+'''
+
+import struct
+from dawg import Dawg, ROOT
+
+SOLUTION_FILE = 'TWL_2006_ALPHA.ghost'
+
+_MAGIC = 'GHST'
+_HEADER = struct.Struct('<4sBxxxIIi') # magic, min word length,
+                                      # dawg nodes, edges, checksum
+_MAX_PLIES = 127
+
+# Internal functions
+def _signature(dawg):
+    return len(dawg), dawg.num_edges(), dawg.checksum()
+
+# Public classes and functions
+class Solution(object):
+    ''' Win/loss table for every Ghost state over a Dawg '''
+    def __init__(self, dawg, min_word_length, table=None, best=None):
+        if not isinstance(dawg, Dawg):
+            raise TypeError('Ghost can only be solved over a Dawg lexicon')
+        self._dawg = dawg
+        self._min_word_length = min_word_length
+        if table is None:
+            table = bytearray((min_word_length + 1) * len(dawg))
+        if best is None:
+            best = bytearray(len(table))
+        self._table = table # 0 = unsolved, else plies << 1 | wins
+        self._best = best   # the best letter to play, 0 for none
+
+    def _index(self, node, depth):
+        return min(depth, self._min_word_length) * len(self._dawg) + node
+
+    def _moves(self, node, depth):
+        ''' (letter, child, forms_word) for every continuation of node '''
+        forms_words = depth + 1 >= self._min_word_length
+        return [(letter, child, forms_words and self._dawg.is_word(child))
+                for letter, child in self._dawg.children(node)]
+
+    def _solve(self, node, depth):
+        ''' Fills in the table below (node, depth) by an iterative post-order
+        walk, so long words cannot exhaust the recursion limit
+        '''
+        table = self._table
+        stack = [(node, depth)]
+        while stack:
+            node, depth = stack[-1]
+            if table[self._index(node, depth)]:
+                stack.pop()
+                continue
+            moves = self._moves(node, depth)
+            unsolved = [(child, depth + 1) for letter, child, forms_word
+                        in moves if not forms_word and
+                        not table[self._index(child, depth + 1)]]
+            if unsolved:
+                stack.extend(unsolved) # come back once they are solved
+                continue
+            # prefer wins, then quick wins or slow losses
+            best, best_key = None, None
+            for letter, child, forms_word in moves:
+                if forms_word:
+                    continue
+                value = table[self._index(child, depth + 1)]
+                child_wins, child_plies = value & 1, value >> 1
+                key = (not child_wins,
+                       child_plies if child_wins else -child_plies)
+                if best_key is None or key > best_key:
+                    best, best_key = letter, key
+            if best is None: # with no safe move, we lose right away
+                wins, plies = False, 1
+            else:
+                wins, plies = best_key[0], abs(best_key[1]) + 1
+                self._best[self._index(node, depth)] = ord(best)
+            table[self._index(node, depth)] = \
+                min(plies, _MAX_PLIES) << 1 | wins
+            stack.pop()
+
+    def solve(self):
+        ''' Solves every state reachable from the empty fragment '''
+        self._solve(ROOT, 0)
+        return self
+
+    def value(self, node, depth):
+        ''' Returns (wins, plies) for the player to move at node, where
+        depth is the length of the fragment
+        '''
+        value = self._table[self._index(node, depth)]
+        if not value:
+            self._solve(node, depth)
+            value = self._table[self._index(node, depth)]
+        return bool(value & 1), value >> 1
+
+    def best_move(self, node, depth):
+        ''' Returns the letter that wins fastest, or if there is none, the
+        one that loses slowest. None if every letter loses on the spot.
+        '''
+        self.value(node, depth) # make sure the state is solved
+        letter = self._best[self._index(node, depth)]
+        return chr(letter) if letter else None
+
+    def save(self, path=SOLUTION_FILE):
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self._min_word_length,
+                                 *_signature(self._dawg)))
+            f.write(self._table)
+            f.write(self._best)
+
+    @classmethod
+    def load(cls, dawg, min_word_length, path=SOLUTION_FILE):
+        ''' Returns the Solution saved at path, or None if it is missing or
+        was solved for a different lexicon or minimum word length
+        '''
+        try:
+            with open(path, 'rb') as f:
+                header = _HEADER.unpack(f.read(_HEADER.size))
+                size = (min_word_length + 1) * len(dawg)
+                table = bytearray(f.read(size))
+                best = bytearray(f.read(size))
+        except (IOError, struct.error):
+            return None
+        if header != (_MAGIC, min_word_length) + _signature(dawg) or \
+                len(best) != size:
+            return None
+        return cls(dawg, min_word_length, table, best)
+
+def load_or_solve(dawg, min_word_length, path=SOLUTION_FILE):
+    ''' Loads the saved Solution for dawg, solving and saving it if needed '''
+    solution = Solution.load(dawg, min_word_length, path)
+    if solution is None:
+        solution = Solution(dawg, min_word_length).solve()
+        try:
+            solution.save(path)
+        except IOError as e:
+            print 'Error writing the solved game.'
+    return solution
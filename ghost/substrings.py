@@ -0,0 +1,121 @@
+''' substrings.py
+Substring index for Superghost, where letters may be added at either end
+of the fragment. It is made of two minimized DAWGs (see dawg.py):
+
+    right   every suffix of every word. A fragment is a substring of a
+            word exactly when it is a prefix of one of these, and the
+            letters that can follow it are the node's continuations.
+    left    every suffix of every reversed word. The letters that can go
+            before a fragment are the continuations of the reversed
+            fragment, and the end of each of these strings is the start
+            of a word.
+
+Every query walks the fragment once, so it takes time proportional to
+its length. Like the lexicon, the index is loaded on first use, from
+compiled files if they are up to date (`python substrings.py compile`),
+otherwise from lexicon.WORDS_FILE.
+'''
+
+import sys
+import lexicon
+from dawg import Dawg
+
+RIGHT_FILE = 'TWL_2006_ALPHA.right.dawg'
+LEFT_FILE = 'TWL_2006_ALPHA.left.dawg'
+
+# Internal functions
+def _suffixes(words):
+    for word in words:
+        for i in range(len(word)):
+            yield word[i:]
+
+def _load():
+    if lexicon._compiled_is_fresh(RIGHT_FILE, lexicon.WORDS_FILE) and \
+            lexicon._compiled_is_fresh(LEFT_FILE, lexicon.WORDS_FILE):
+        return SubstringIndex(Dawg.load(RIGHT_FILE), Dawg.load(LEFT_FILE))
+    return SubstringIndex.from_words(
+        list(lexicon._read_words(lexicon.WORDS_FILE)))
+
+def _get_index():
+    global _index
+    if _index is None:
+        _index = _load()
+    return _index
+
+_index = None # loaded on first use
+
+# Public classes and functions
+class SubstringIndex(object):
+    ''' Answers which strings occur inside words, and how they can grow '''
+    def __init__(self, right, left):
+        self._right = right
+        self._left = left
+
+    @classmethod
+    def from_words(cls, words):
+        return cls(Dawg.from_words(_suffixes(words)),
+                   Dawg.from_words(_suffixes(word[::-1] for word in words)))
+
+    def save(self, right_file=RIGHT_FILE, left_file=LEFT_FILE,
+             source=(0, 0.0)):
+        self._right.save(right_file, source)
+        self._left.save(left_file, source)
+
+    def has_substring(self, fragment):
+        return self._right.traverse(fragment) is not None
+
+    def right_extensions(self, fragment):
+        ''' Letters that can be added after fragment, or None '''
+        node = self._right.traverse(fragment)
+        if node is not None:
+            return self._right.letters(node)
+        else:
+            return None
+
+    def left_extensions(self, fragment):
+        ''' Letters that can be added before fragment, or None '''
+        node = self._left.traverse(fragment[::-1])
+        if node is not None:
+            return self._left.letters(node)
+        else:
+            return None
+
+    def word_containing(self, fragment):
+        ''' A word with fragment inside it, or None '''
+        node = self._left.traverse(fragment[::-1])
+        if node is None:
+            return None
+        # the shortest way back to the start of a word gives the start of
+        # a word that contains fragment, which the lexicon can finish
+        start = self._left.shortest_word(node, fragment[::-1])[::-1]
+        return lexicon.shortest_word(start)
+
+def has_substring(fragment):
+    return _get_index().has_substring(fragment)
+
+def right_extensions(fragment):
+    return _get_index().right_extensions(fragment)
+
+def left_extensions(fragment):
+    return _get_index().left_extensions(fragment)
+
+def word_containing(fragment):
+    return _get_index().word_containing(fragment)
+
+def compile(words_file=lexicon.WORDS_FILE, right_file=RIGHT_FILE,
+            left_file=LEFT_FILE):
+    ''' Builds the index from words_file and saves it '''
+    index = SubstringIndex.from_words(list(lexicon._read_words(words_file)))
+    index.save(right_file, left_file, lexicon._source_stamp(words_file))
+    return index
+
+# Sanity checks
+if __name__ == '__main__' and sys.argv[1:] == ['compile']:
+    compile()
+elif __name__ == '__main__':
+    _index = SubstringIndex.from_words(['ghost', 'host', 'hostel'])
+    print has_substring('os')        # True
+    print has_substring('sg')        # False
+    print right_extensions('ost')    # ['e']
+    print left_extensions('ost')     # ['h']
+    print right_extensions('xyz')    # None
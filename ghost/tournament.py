@@ -0,0 +1,145 @@
+''' tournament.py
+Plays many headless games between two GhostPlayer classes across a
+process pool, and reports games per second, win rates and per-move
+latency percentiles. For example:
+
+    python tournament.py SimpleGhostPlayer PerfectGhostPlayer 100000
+
+The lexicon is built once in the parent process and put in shared
+memory, and the players are set up there too; the forked workers share
+them instead of loading their own. With a log path, each worker records
+its games in a game log of its own, LOG.<pid> (see gamelog.py).
+'''
+
+import math
+import multiprocessing
+import os
+import random
+import sys
+import timeit
+from collections import Counter
+import engine
+import gamelog
+import ghostplayer
+import lexicon
+from ghost import Ghost
+
+_BUCKETS_PER_DOUBLING = 16 # latency histogram resolution, about 4%
+_RESULT_NAMES = {Ghost._FORMED_WORD: 'formed word',
+                 Ghost._WON_CHALLENGE: 'won challenge',
+                 Ghost._LOST_CHALLENGE: 'lost challenge'}
+
+_players = None # set in the parent, inherited by the workers
+_log_path = None # likewise
+_log = None # opened by each worker on its first chunk
+
+# Internal functions
+def _bucket(seconds):
+    ''' Latency histogram bucket for a move that took seconds '''
+    microseconds = max(seconds * 1e6, 1.0)
+    return int(math.log(microseconds, 2) * _BUCKETS_PER_DOUBLING)
+
+def _percentile(histogram, fraction):
+    ''' Upper bound in microseconds of the given fraction of latencies '''
+    total = sum(histogram.values())
+    if not total:
+        return 0.0
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= fraction * total:
+            return 2 ** (float(bucket + 1) / _BUCKETS_PER_DOUBLING)
+
+def _play_chunk(args):
+    ''' Plays num_games games, the players taking turns to go first '''
+    global _log
+    first_game, num_games, seed = args
+    if _log_path is not None and _log is None:
+        _log = gamelog.GameLog('{0}.{1}'.format(_log_path, os.getpid()))
+    random.seed(None if seed is None else (seed, first_game))
+    wins = [0, 0]
+    results = Counter()
+    histograms = (Counter(), Counter())
+    for game in xrange(first_game, first_game + num_games):
+        first = game % 2
+        order = (_players[first], _players[1 - first])
+        latencies = ([], [])
+        winner, result, fragment = engine.play_game(order, latencies, _log)
+        wins[(first + winner) % 2] += 1
+        results[result] += 1
+        for i in range(2):
+            histograms[(first + i) % 2].update(
+                _bucket(seconds) for seconds in latencies[i])
+    if _log is not None:
+        _log.flush()
+    return wins, results, histograms
+
+# Public functions
+def run(player_classes, num_games, processes=None, chunk_size=1000,
+        seed=None, log_path=None):
+    ''' Plays num_games games between instances of the two player classes
+    on a pool of processes (one per core by default), recording them in
+    game logs named after log_path if it is given.
+
+    Returns a dict with the players' names, the number of games, elapsed
+    seconds, games per second, wins, result counts and p50/p90/p99 move
+    latencies in microseconds for each player.
+    '''
+    global _players, _log_path
+    lexicon.share() # load once, into memory the forked workers share
+    _log_path = log_path
+    _players = [cls() for cls in player_classes]
+    chunks = [(start, min(chunk_size, num_games - start), seed)
+              for start in xrange(0, num_games, chunk_size)]
+    start = timeit.default_timer()
+    pool = multiprocessing.Pool(processes)
+    try:
+        outcomes = pool.map(_play_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = timeit.default_timer() - start
+
+    wins = [0, 0]
+    results = Counter()
+    histograms = (Counter(), Counter())
+    for chunk_wins, chunk_results, chunk_histograms in outcomes:
+        wins = [wins[i] + chunk_wins[i] for i in range(2)]
+        results.update(chunk_results)
+        for i in range(2):
+            histograms[i].update(chunk_histograms[i])
+    return {'players': [cls.__name__ for cls in player_classes],
+            'games': num_games,
+            'seconds': elapsed,
+            'games_per_second': num_games / elapsed if elapsed else 0.0,
+            'wins': wins,
+            'results': dict((_RESULT_NAMES[result], count)
+                            for result, count in results.iteritems()),
+            'latency_us': [dict(('p{0}'.format(int(fraction * 100)),
+                                 _percentile(histogram, fraction))
+                                for fraction in (0.5, 0.9, 0.99))
+                           for histogram in histograms]}
+
+def display(report):
+    ''' Prints a report returned by run() '''
+    print '{0} games in {1}s ({2} games/s)'.format(
+        report['games'], round(report['seconds'], 2),
+        int(report['games_per_second']))
+    for result, count in sorted(report['results'].iteritems()):
+        print '  {0}: {1}'.format(result, count)
+    for i, name in enumerate(report['players']):
+        latency = report['latency_us'][i]
+        print '{0}: {1:.1%} wins, move latency p50 {2:.0f}us ' \
+            'p90 {3:.0f}us p99 {4:.0f}us'.format(
+                name, float(report['wins'][i]) / max(report['games'], 1),
+                latency['p50'], latency['p90'], latency['p99'])
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5, 6):
+        print 'usage: python tournament.py PLAYER PLAYER GAMES [PROCESSES] ' \
+            '[LOG]'
+        sys.exit(1)
+    classes = [getattr(ghostplayer, name) for name in sys.argv[1:3]]
+    processes = int(sys.argv[4]) if len(sys.argv) >= 5 else None
+    log_path = sys.argv[5] if len(sys.argv) == 6 else None
+    display(run(classes, int(sys.argv[3]), processes, log_path=log_path))
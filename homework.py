@@ -1,9 +1,9 @@
 #! /usr/bin/python
 
+import multiprocessing
 import random
-import time
-import matplotlib.pyplot as plt
-import scipy 
+import timeit
+import numpy as np
 
 def cycle(list):
     return list[1:] + list[0:1]
@@ -36,22 +36,447 @@ def find_combinations(target, a, b, c):
     
     return None
 
+class _Restart(Exception):
+    ''' Raised to give up on a search that is taking too long '''
 
-def generate_puzzle(target, numCombos):
+def _value_masks(values):
+    ''' Maps each value to a bitmask of the indices it is found at '''
+    masks = {}
+    for i, value in enumerate(values):
+        masks[value] = masks.get(value, 0) | 1 << i
+    return masks
+
+def _lowest_bit(mask):
+    return (mask & -mask).bit_length() - 1
+
+def _search(masks, options, used, left, triples, failed, budget, rng):
+    ''' Matches the left numbers not in the used masks into triples, or
+    returns False if they cannot be matched
+    '''
+    budget[0] -= 1
+    if budget[0] < 0:
+        raise _Restart
+    if not left:
+        return True
+    state = tuple(used)
+    if state in failed:
+        return False
+    free = [dict((value, bin(mask & ~used[i]).count('1'))
+                 for value, mask in masks[i].iteritems()) for i in range(3)]
+
+    # Forward checking: every number left must still be in a triple with
+    # two other free numbers. The number with the fewest is matched first.
+    best = None
+    for i in range(3):
+        for value, count in free[i].iteritems():
+            if not count:
+                continue
+            sums = [triple for triple in options[i][value]
+                    if free[0][triple[0]] and free[1][triple[1]] and
+                    free[2][triple[2]]]
+            if not sums:
+                failed.add(state)
+                return False
+            key = (len(sums), -count, rng.random())
+            if best is None or key < best_key:
+                best, best_key = sums, key
+
+    rng.shuffle(best)
+    for triple in best:
+        # equal numbers are interchangeable, so only the first free one
+        # is tried
+        indices = [_lowest_bit(masks[i][triple[i]] & ~used[i])
+                   for i in range(3)]
+        triples[indices[2]] = triple
+        if _search(masks, options,
+                   [used[i] | 1 << indices[i] for i in range(3)], left - 1,
+                   triples, failed, budget, rng):
+            return True
+    failed.add(state)
+    return False
+
+def find_combinations_fast(target, a, b, c):
+    ''' Same as find_combinations, by constraint propagation instead of
+    rotating the lists. The numbers used so far are kept as bitmasks, and
+    the number that fits in the fewest triples is matched first; a partial
+    match is dropped as soon as a number has nothing left to go with.
+    Searches that run long are restarted, in a different order, with a
+    bigger budget each time. The triples are in the order of c.
+    '''
+    if len(a) != len(b) or len(a) != len(c):
+        raise Exception('Input lists must have same length')
+    if not a or sum(a) + sum(b) + sum(c) != target * len(a):
+        return None
+
+    # every way to make target from the values in the lists, found through
+    # the value -> indices hash of c, and options[i][value]: the ones
+    # that use value from list i
+    masks = [_value_masks(values) for values in (a, b, c)]
+    options = [dict((value, []) for value in m) for m in masks]
+    for x in masks[0]:
+        for y in masks[1]:
+            if target - x - y in masks[2]:
+                triple = (x, y, target - x - y)
+                for i in range(3):
+                    options[i][triple[i]].append(triple)
+
+    triples = [None] * len(c)
+    failed = set() # states with no solution, still true after a restart
+    rng = random.Random(0) # for a different but reproducible order
+    budget = 2 * len(a)
+    while True:
+        try:
+            if _search(masks, options, [0, 0, 0], len(a), triples, failed,
+                       [budget], rng):
+                return triples
+            return None
+        except _Restart:
+            budget = budget * 3 // 2
+
+def _count(target, c, a_masks, b_masks, used_a, used_b, last, memo):
+    ''' Number of ways to match c (sorted) from position popcount(used_a)
+    on with the free numbers of a and b. last is the (a, b) pair the
+    previous number was matched with if it equals the next one, as equal
+    numbers of c are matched with nondecreasing pairs so that each set of
+    triples is counted once.
+    '''
+    k = bin(used_a).count('1')
+    if k == len(c):
+        return 1
+    key = (used_a, used_b, last)
+    if key in memo:
+        return memo[key]
+    total = 0
+    z = c[k]
+    tied = k + 1 < len(c) and c[k + 1] == z
+    for x in sorted(a_masks):
+        y = target - z - x
+        if last is not None and (x, y) < last:
+            continue
+        free_a = a_masks[x] & ~used_a
+        free_b = b_masks.get(y, 0) & ~used_b
+        if free_a and free_b:
+            # equal numbers are interchangeable, so take the first free one
+            total += _count(target, c, a_masks, b_masks,
+                            used_a | free_a & -free_a,
+                            used_b | free_b & -free_b,
+                            (x, y) if tied else None, memo)
+    memo[key] = total
+    return total
+
+def _prepare(target, a, b, c):
+    if len(a) != len(b) or len(a) != len(c):
+        raise Exception('Input lists must have same length')
+    order = sorted(range(len(c)), key=c.__getitem__)
+    return [c[k] for k in order], order, _value_masks(a), _value_masks(b)
+
+def count_solutions(target, a, b, c):
+    ''' Number of different sets of triples that solve the puzzle. Sets
+    that only differ in which of two equal numbers they use are the same.
+    Partial matches that use the same numbers are counted once and shared,
+    so the solutions are never enumerated.
+    '''
+    c, order, a_masks, b_masks = _prepare(target, a, b, c)
+    if not c or sum(a) + sum(b) + sum(c) != target * len(a):
+        return 0
+    return _count(target, c, a_masks, b_masks, 0, 0, None, {})
+
+def all_combinations(target, a, b, c):
+    ''' Yields every different solution of the puzzle, each as a list of
+    triples in the order of c like find_combinations, one at a time.
+    Branches with no solution in them are never entered.
+    '''
+    c_sorted, order, a_masks, b_masks = _prepare(target, a, b, c)
+    if not c or sum(a) + sum(b) + sum(c) != target * len(a):
+        return
+    memo = {}
+    triples = [None] * len(c)
+    # each stack entry is (used_a, used_b, last, pairs still to try)
+    stack = [(0, 0, None, None)]
+    while stack:
+        used_a, used_b, last, pairs = stack.pop()
+        k = bin(used_a).count('1')
+        if k == len(c):
+            yield list(triples)
+            continue
+        z = c_sorted[k]
+        if pairs is None:
+            pairs = [(x, target - z - x) for x in sorted(a_masks, reverse=True)
+                     if last is None or (x, target - z - x) >= last]
+        tied = k + 1 < len(c) and c_sorted[k + 1] == z
+        while pairs:
+            x, y = pairs.pop()
+            free_a = a_masks[x] & ~used_a
+            free_b = b_masks.get(y, 0) & ~used_b
+            if not (free_a and free_b):
+                continue
+            next_a = used_a | free_a & -free_a
+            next_b = used_b | free_b & -free_b
+            next_last = (x, y) if tied else None
+            if _count(target, c_sorted, a_masks, b_masks, next_a, next_b,
+                      next_last, memo):
+                triples[order[k]] = (x, y, z)
+                stack.append((used_a, used_b, last, pairs))
+                stack.append((next_a, next_b, next_last, None))
+                break
+
+def _sum_index(masks):
+    ''' Maps every sum of one value from each of the lists with these value
+    masks to the tuples of values that make it
+    '''
+    index = {0: [()]}
+    for value_masks in masks:
+        next_index = {}
+        for total, groups in index.iteritems():
+            for value in value_masks:
+                next_index.setdefault(total + value, []).extend(
+                    group + (value,) for group in groups)
+        index = next_index
+    return index
+
+def _search_k(target, masks, halves, used, left, groups, failed, budget,
+              rng):
+    ''' Like _search, for groups of one number from each list. halves[i]
+    holds, for a number of list i, the lists the rest of its group comes
+    from, split in two: an index of the sums of the first half, and the
+    sums of the second half, whose complements are looked up in it.
+    '''
+    budget[0] -= 1
+    if budget[0] < 0:
+        raise _Restart
+    if not left:
+        return True
+    state = tuple(used)
+    if state in failed:
+        return False
+    free = lambda i, value: masks[i][value] & ~used[i]
+
+    # Forward checking: every number left must still be in a group of free
+    # numbers. The number in the fewest is matched first.
+    best = None
+    for i, (first_lists, first, second_lists, second) in enumerate(halves):
+        free_second = [(total, tail) for total, tail in second
+                       if all(free(j, value)
+                              for j, value in zip(second_lists, tail))]
+        for x in masks[i]:
+            count = bin(free(i, x)).count('1')
+            if not count:
+                continue
+            candidates = []
+            for total, tail in free_second:
+                for head in first.get(target - x - total, ()):
+                    if all(free(j, value)
+                           for j, value in zip(first_lists, head)):
+                        candidates.append((i, x, head, tail))
+            if not candidates:
+                failed.add(state)
+                return False
+            key = (len(candidates), -count, rng.random())
+            if best is None or key < best_key:
+                best, best_key = candidates, key
+
+    rng.shuffle(best)
+    last = len(masks) - 1
+    for i, x, head, tail in best:
+        first_lists, _, second_lists, _ = halves[i]
+        group = [None] * len(masks)
+        for j, value in zip([i] + first_lists + second_lists,
+                            (x,) + head + tail):
+            group[j] = value
+        # equal numbers are interchangeable, so only the first free one
+        # is tried
+        bits = [free(j, value) & -free(j, value)
+                for j, value in enumerate(group)]
+        groups[_lowest_bit(bits[last])] = tuple(group)
+        if _search_k(target, masks, halves,
+                     [used[j] | bits[j] for j in range(len(masks))],
+                     left - 1, groups, failed, budget, rng):
+            return True
+    failed.add(state)
+    return False
+
+def find_combinations_k(target, lists):
+    ''' Generalizes find_combinations to any number of lists: picks one
+    number from each list for each group so every group sums to target.
+    Returns a list of groups (tuples, one number from each list) in the
+    order of the last list, or None if there is no solution.
+
+    The groups a number can be in are found by meeting in the middle: the
+    other lists are split in two halves, the sums of one value from each
+    list of the first half are indexed once, and the complement of every
+    sum of the second half is looked up in the index. The search is
+    otherwise that of find_combinations_fast.
+    '''
+    lists = [list(numbers) for numbers in lists]
+    if not lists:
+        raise Exception('Need at least one list')
+    if any(len(numbers) != len(lists[0]) for numbers in lists):
+        raise Exception('Input lists must have same length')
+    if not lists[0] or sum(map(sum, lists)) != target * len(lists[0]):
+        return None
+
+    masks = [_value_masks(numbers) for numbers in lists]
+    halves = []
+    for i in range(len(lists)):
+        others = [j for j in range(len(lists)) if j != i]
+        first_lists = others[:len(others) // 2]
+        second_lists = others[len(others) // 2:]
+        second = _sum_index([masks[j] for j in second_lists])
+        halves.append((first_lists,
+                       _sum_index([masks[j] for j in first_lists]),
+                       second_lists,
+                       [(total, tail) for total, tails in second.iteritems()
+                        for tail in tails]))
+
+    groups = [None] * len(lists[0])
+    failed = set()
+    rng = random.Random(0)
+    budget = 2 * len(lists[0])
+    while True:
+        try:
+            if _search_k(target, masks, halves, [0] * len(lists),
+                         len(lists[0]), groups, failed, [budget], rng):
+                return groups
+            return None
+        except _Restart:
+            budget = budget * 3 // 2
+
+def scaling_benchmark(num_lists, num_combos, runs=5, give_up=1.0):
+    ''' Prints the average time find_combinations_k takes for each number
+    of lists and of combos, with a target of 33 per list. As soon as one
+    puzzle takes more than give_up seconds, the rest of its runs and the
+    larger sizes are skipped; the average of the puzzles that did run is
+    then marked with a '*'.
+    '''
+    print 'Lists\\Combos' + ''.join('{0:>10d}'.format(num)
+                                    for num in num_combos)
+    for k in num_lists:
+        line = '{0:12d}'.format(k)
+        too_slow = False
+        for num in num_combos:
+            if too_slow:
+                line += '{0:>10}'.format('-')
+                continue
+            total = 0.0
+            for i in range(runs):
+                puzzle = generate_puzzle(33 * k, num, k)
+                start = timeit.default_timer()
+                find_combinations_k(33 * k, puzzle)
+                elapsed = timeit.default_timer() - start
+                total += elapsed
+                if elapsed > give_up:
+                    too_slow = True
+                    break
+            line += '{0:>10}'.format('{0:.4f}{1}'.format(
+                total / (i + 1), '*' if too_slow else ''))
+        print line
+
+def compare_solvers(solvers, num_combos, target=99, runs=10, give_up=1.0):
+    ''' Prints the average time each solver takes on the same generated
+    puzzles, for each number of combos. A solver is left out of the larger
+    sizes once it takes more than give_up seconds on average, as its time
+    can grow exponentially.
+    '''
+    print 'Combos' + ''.join('{0:>24}'.format(solver.__name__)
+                             for solver in solvers)
+    slow = set()
+    for num in num_combos:
+        puzzles = [generate_puzzle(target, num) for i in range(runs)]
+        line = '{0:6d}'.format(num)
+        for solver in solvers:
+            if solver in slow:
+                line += '{0:>24}'.format('-')
+                continue
+            start = timeit.default_timer()
+            for x, y, z in puzzles:
+                solver(target, x, y, z)
+            average = (timeit.default_timer() - start) / runs
+            if average > give_up:
+                slow.add(solver)
+            line += '{0:24f}'.format(average)
+        print line
+
+
+def generate_puzzle(target, numCombos, numLists=3):
     ''' Generates a new puzzle for a given target sum, with
-    numCombos combinations.
+    numCombos combinations of numLists numbers each (a, b, c by default).
     So far, only positive summands are generated.
     '''
-    assert target >= 3
-    a, b, c = [], [], []
+    assert target >= numLists
+    lists = [[] for j in range(numLists)]
     for i in range(numCombos):
-        a.append(random.randint(1, target - 2))
-        b.append(random.randint(1, target - a[i] - 1))
-        c.append(target - a[i] - b[i]) 
-    random.shuffle(a)
-    random.shuffle(b)
-    random.shuffle(c)
-    return a, b, c
+        left = target
+        for j in range(numLists - 1):
+            # leave at least 1 for each list still to go
+            lists[j].append(random.randint(1, left - (numLists - 1 - j)))
+            left -= lists[j][i]
+        lists[-1].append(left)
+    for numbers in lists:
+        random.shuffle(numbers)
+    return tuple(lists)
+
+def generate_puzzles(target, numCombos, numPuzzles, seed=None):
+    ''' Generates numPuzzles puzzles like generate_puzzle does, all at
+    once, as an array of shape (numPuzzles, 3, numCombos): puzzles[i] holds
+    the lists a, b and c of puzzle i.
+    '''
+    assert target >= 3
+    rng = np.random.RandomState(seed)
+    shape = (numPuzzles, numCombos)
+    a = rng.randint(1, target - 1, shape)
+    # uniform in 1 .. target - a - 1, like random.randint
+    b = 1 + (rng.random_sample(shape) * (target - a - 1)).astype(int)
+    puzzles = np.stack([a, b, target - a - b], axis=1)
+    # shuffle each list on its own: sort by random keys
+    order = np.argsort(rng.random_sample(puzzles.shape), axis=2)
+    return np.take_along_axis(puzzles, order, axis=2)
+
+def screen_puzzles(target, puzzles, chunk_size=1000):
+    ''' Returns a boolean array of the puzzles that might have a solution:
+    the numbers add up, and every number has a pair from the other two
+    lists to make target with. The others certainly have none. The checks
+    are done on tables of pair sums, chunk_size puzzles at a time.
+    '''
+    puzzles = np.asarray(puzzles)
+    num_combos = puzzles.shape[2]
+    ok = puzzles.sum(axis=(1, 2)) == target * num_combos
+    for start in range(0, len(puzzles), chunk_size):
+        chunk = puzzles[start:start + chunk_size]
+        for i in range(3):
+            j, k = [x for x in range(3) if x != i]
+            # sums[p, m, n]: list j's m-th number plus list k's n-th
+            sums = chunk[:, j, :, None] + chunk[:, k, None, :]
+            needed = target - chunk[:, i, :, None, None]
+            has_pair = (sums[:, None] == needed).any(axis=(2, 3))
+            ok[start:start + chunk_size] &= has_pair.all(axis=1)
+    return ok
+
+def _solve_puzzle(args):
+    ''' Runs in a worker process '''
+    solver, target, puzzle = args
+    return solver(target, *[list(numbers) for numbers in puzzle])
+
+def solve_puzzles(target, puzzles, solver=None, processes=None,
+                  chunk_size=100):
+    ''' Solves many puzzles on a pool of processes (one per core by
+    default), returning a list with solver's answer for each. The puzzles
+    that fail screen_puzzles get None (or 0 when counting) without being
+    searched. Use count_solutions as the solver to validate puzzles.
+    '''
+    solver = solver or find_combinations_fast
+    puzzles = np.asarray(puzzles).tolist()
+    ok = screen_puzzles(target, puzzles)
+    work = [(solver, target, puzzles[i]) for i in np.flatnonzero(ok)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        answers = pool.map(_solve_puzzle, work, chunk_size)
+    finally:
+        pool.close()
+        pool.join()
+    results = [0 if solver is count_solutions else None] * len(puzzles)
+    for i, answer in zip(np.flatnonzero(ok), answers):
+        results[i] = answer
+    return results
 
 if __name__ == '__main__':
     # Baby example
@@ -80,39 +505,33 @@ if __name__ == '__main__':
     print find_combinations(6, x, y, z)
     print
 
-    # Check the time complexity empirically
-    print '{0}    {1}'.format("Combos", "Avg Time")
-    target = 99
-    runs = 10
-    num_combos = [0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 14, 16]
-    times = []
-    for num in num_combos:
-        t = []
-        for i in range(runs):
-            x, y, z = generate_puzzle(target, num)
-            start = time.clock()
-            find_combinations(target, x, y, z)
-            end = time.clock()
-            t.append(end - start)
-        times.append(t)
-        print '{0:6d}    {1:8f}'.format(num, scipy.mean(t))
-
-    for i in range(len(num_combos)):
-        xs = [num_combos[i]] * runs
-        ys = times[i]
-        plt.scatter(xs, ys, s=30, alpha=0.5)
-        plt.scatter(num_combos[i], scipy.mean(times[i]), 
-                        c='r', s=50, alpha=0.7, marker ='D')
-
-    plt.xlim(xmin=0, xmax=max(num_combos) + 1)
-    plt.semilogy()
-    plt.show()
-
-
-
+    # Is the homework answer the only one?
+    print 'solutions:', count_solutions(target, a, b, c)
+    print
 
+    # Screen a batch of generated puzzles for the ones with one answer
+    puzzles = generate_puzzles(target, 12, 10000, seed=12)
+    counts = solve_puzzles(target, puzzles, count_solutions)
+    print '{0} of {1} generated puzzles have a unique answer'.format(
+        counts.count(1), len(puzzles))
+    print
 
-        
-    
-    
+    # The constraint propagation solver scales much further
+    print find_combinations_fast(target, a, b, c)
+    print
+    # Any number of lists, by meet in the middle
+    print find_combinations_k(target, [a, b, c])
+    print
+    scaling_benchmark([2, 3, 4, 5, 6], [4, 8, 16, 32, 64])
+    print
+    compare_solvers([find_combinations, find_combinations_fast],
+                    [4, 8, 12, 14, 16, 18, 20, 24, 32, 64, 128, 256], runs=5)
+    print
 
+    # Check the time complexity empirically (see homework_benchmark.py,
+    # which also saves a plot when matplotlib is installed)
+    import homework_benchmark
+    results = homework_benchmark.run(['find_combinations'],
+                                     [0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 14, 16],
+                                     runs=10)
+    homework_benchmark.display(results)
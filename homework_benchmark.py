@@ -0,0 +1,205 @@
+#! /usr/bin/python
+
+''' homework_benchmark.py
+Times the registered homework solvers over a sweep of puzzle sizes, with
+fixed seeds so every run sees the same puzzles, and reports the median
+and 95th percentile times and how fast the time grows with the size.
+Nothing is plotted on screen, so it runs headless (in CI, say).
+
+    python homework_benchmark.py [RESULTS_FILE] [BASELINE_FILE] [--plot PNG]
+
+Results are written as JSON (RESULTS_FILE, homework_benchmark.json by
+default). With a baseline, times that got more than 20% slower are
+reported and the exit status is 1. --plot saves a plot of the times, if
+matplotlib is installed.
+'''
+
+import json
+import math
+import random
+import sys
+import time
+import timeit
+import homework
+
+RESULTS_FILE = 'homework_benchmark.json'
+SIZES = [2, 4, 8, 12, 16, 24, 32, 64, 128]
+RUNS = 5
+TARGET = 99
+SEED = 99
+GIVE_UP = 1.0 # seconds per puzzle after which larger sizes are skipped
+THRESHOLD = 0.2 # relative slowdown worth reporting against a baseline
+NOISE_FLOOR = 1e-3 # seconds; times below this are too noisy to compare
+
+SOLVERS = {} # name -> (solve(target, puzzle), largest size to try or None)
+
+# Internal functions
+def _percentile(times, fraction):
+    ''' Nearest rank percentile of times '''
+    times = sorted(times)
+    return times[max(int(math.ceil(fraction * len(times))) - 1, 0)]
+
+def _fit(xs, ys):
+    ''' Least squares line through (xs, ys): (slope, r squared) '''
+    n = float(len(xs))
+    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    syy = sum((y - mean_y) ** 2 for y in ys)
+    if not sxx:
+        return 0.0, 0.0
+    slope = sxy / sxx
+    return slope, (sxy * sxy / (sxx * syy) if syy else 1.0)
+
+def _growth(sizes):
+    ''' Fits the median times to t ~ size ** exponent and to
+    t ~ factor ** size, and says which fits better
+    '''
+    points = [(int(size), stats['median_s'])
+              for size, stats in sizes.iteritems()
+              if int(size) > 0 and stats['median_s'] > 0]
+    if len(points) < 3:
+        return None
+    xs = [size for size, _ in points]
+    logs = [math.log(seconds) for _, seconds in points]
+    exponent, polynomial_r2 = _fit([math.log(x) for x in xs], logs)
+    rate, exponential_r2 = _fit(xs, logs)
+    return {'exponent': exponent, 'polynomial_r2': polynomial_r2,
+            'factor_per_combo': math.exp(rate),
+            'exponential_r2': exponential_r2,
+            'model': 'exponential' if exponential_r2 > polynomial_r2
+                     else 'polynomial'}
+
+def _time(solve, puzzles, target):
+    times = []
+    timer = timeit.default_timer # time.perf_counter is Python 3 only
+    for puzzle in puzzles:
+        start = timer()
+        solve(target, puzzle)
+        times.append(timer() - start)
+    return times
+
+# Public functions
+def register(name, solver, max_combos=None):
+    ''' Adds a solver to benchmark. solver(target, puzzle) gets the tuple
+    of lists from homework.generate_puzzle. Sizes over max_combos are not
+    tried.
+    '''
+    SOLVERS[name] = (solver, max_combos)
+
+register('find_combinations',
+         lambda target, puzzle: homework.find_combinations(target, *puzzle),
+         16)
+register('find_combinations_fast',
+         lambda target, puzzle:
+             homework.find_combinations_fast(target, *puzzle))
+register('find_combinations_k', homework.find_combinations_k)
+register('count_solutions',
+         lambda target, puzzle: homework.count_solutions(target, *puzzle),
+         20)
+
+def run(solvers=None, sizes=SIZES, runs=RUNS, target=TARGET, seed=SEED,
+        give_up=GIVE_UP):
+    ''' Times each solver runs times at each size, on the same puzzles for
+    every solver. Returns the results as a dict.
+    '''
+    results = {}
+    for name in solvers or sorted(SOLVERS):
+        solve, max_combos = SOLVERS[name]
+        stats = {}
+        for size in sizes:
+            if max_combos is not None and size > max_combos:
+                break
+            random.seed(seed + size)
+            puzzles = [homework.generate_puzzle(target, size)
+                       for i in range(runs)]
+            times = _time(solve, puzzles, target)
+            stats[str(size)] = {'median_s': _percentile(times, 0.5),
+                                'p95_s': _percentile(times, 0.95),
+                                'mean_s': sum(times) / len(times)}
+            if stats[str(size)]['median_s'] > give_up:
+                break
+        results[name] = {'sizes': stats, 'growth': _growth(stats)}
+    return {'timestamp': time.time(), 'target': target, 'runs': runs,
+            'seed': seed, 'solvers': results}
+
+def compare(results, baseline, threshold=THRESHOLD, noise_floor=NOISE_FLOOR):
+    ''' Returns (solver, size, metric, baseline, current) for every median
+    or p95 time that got more than threshold slower
+    '''
+    regressions = []
+    for name, result in sorted(results['solvers'].iteritems()):
+        previous = baseline['solvers'].get(name, {}).get('sizes', {})
+        for size, stats in sorted(result['sizes'].iteritems(),
+                                  key=lambda item: int(item[0])):
+            for metric in ('median_s', 'p95_s'):
+                if size not in previous:
+                    continue
+                old, new = previous[size][metric], stats[metric]
+                if max(old, new) >= noise_floor and \
+                        new > old * (1 + threshold):
+                    regressions.append((name, int(size), metric, old, new))
+    return regressions
+
+def display(results):
+    ''' Prints the results returned by run() '''
+    for name, result in sorted(results['solvers'].iteritems()):
+        print name
+        print '{0:>8}  {1:>12}  {2:>12}'.format('Combos', 'Median', 'p95')
+        for size, stats in sorted(result['sizes'].iteritems(),
+                                  key=lambda item: int(item[0])):
+            print '{0:>8}  {1:12.6f}  {2:12.6f}'.format(
+                size, stats['median_s'], stats['p95_s'])
+        growth = result['growth']
+        if growth and growth['model'] == 'exponential':
+            print '  grows about {0:.2f}x per combo (r2 {1:.2f})'.format(
+                growth['factor_per_combo'], growth['exponential_r2'])
+        elif growth:
+            print '  grows about as combos ** {0:.2f} (r2 {1:.2f})'.format(
+                growth['exponent'], growth['polynomial_r2'])
+        print
+
+def plot(results, path):
+    ''' Saves a plot of the median times to path. Returns False if
+    matplotlib is not installed.
+    '''
+    try:
+        import matplotlib
+    except ImportError:
+        return False
+    matplotlib.use('Agg') # no display needed
+    import matplotlib.pyplot as plt
+    for name, result in sorted(results['solvers'].iteritems()):
+        sizes = sorted(result['sizes'], key=int)
+        plt.plot([int(size) for size in sizes],
+                 [result['sizes'][size]['median_s'] for size in sizes],
+                 marker='D', alpha=0.7, label=name)
+    plt.semilogy()
+    plt.xlabel('Combos')
+    plt.ylabel('Median seconds')
+    plt.legend(loc='upper left')
+    plt.savefig(path)
+    plt.close()
+    return True
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    plot_file = None
+    if '--plot' in args:
+        plot_file = args.pop(args.index('--plot') + 1)
+        args.remove('--plot')
+    results = run()
+    with open(args[0] if args else RESULTS_FILE, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    display(results)
+    if plot_file and not plot(results, plot_file):
+        print 'matplotlib is not installed, not plotting'
+    if len(args) > 1:
+        with open(args[1]) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline)
+        for name, size, metric, old, new in regressions:
+            print '{0} {1} combos {2}: {3:.4g} -> {4:.4g} ({5:+.0%})'.format(
+                name, size, metric, old, new, (new - old) / old)
+        if regressions:
+            sys.exit(1)
@@ -11,6 +11,7 @@ from collections import defaultdict
 import cPickle as pickle
 import re
 import sys
+import numpy as np
 import utilities
 from utilities import safe_float, safe_int
 
@@ -19,7 +20,7 @@ DATA_FOLDER = '../../../Desktop/data'
 EPISODES_FILE = 'physiological-full-sparse.csv'
 OUTCOMES_FILE = 'outcomes.csv'
 
-EPISODES_PICKLE = EPISODES_FILE.replace('csv', 'pkl')
+CACHE_FOLDER = '/'.join((DATA_FOLDER, 'cache'))
 
 NUM_VARS = 13
 
@@ -38,28 +39,143 @@ def _parse_episodes_file(f):
         episodes.append((id,  episode))
     return headers, episodes
 
-# Public functions
+def _parse_episodes_arrays(f):
+    """ Like _parse_episodes_file, into an Episodes object """
+    headers = f.readline().strip().split(',')
+    ids, lengths, chunks = [], [], []
+    for line in f:
+        split = re.split(',|:', line)
+        data = np.array(split[1:], dtype=float).reshape(-1, 3)
+        ids.append(int(split[0]))
+        lengths.append(len(data))
+        chunks.append(data)
+    data = np.concatenate(chunks) if chunks else np.zeros((0, 3))
+    episode = np.repeat(np.arange(len(ids)), lengths)
+    var = data[:, 1].astype(np.int16) - 1 # convert for 0-indexing
+
+    # drop unknown variables, which would land in a neighbour's series
+    known = (var >= 0) & (var < NUM_VARS)
+    data, episode, var = data[known], episode[known], var[known]
+
+    # a stable sort, so each series stays in file order
+    segment = episode * NUM_VARS + var
+    order = np.argsort(segment, kind='mergesort')
+    offsets = np.searchsorted(segment[order],
+                              np.arange(len(ids) * NUM_VARS + 1))
+    return Episodes(np.asarray(ids), data[order, 0], data[order, 2],
+                    var[order], offsets, headers)
+
+def _load_episode_lists():
+    with open('/'.join((DATA_FOLDER, EPISODES_FILE))) as f:
+        headers, episodes = _parse_episodes_file(f)
+            
+    print '{0} episodes loaded.'.format(len(episodes))
+    return headers, episodes
+
+def _load_episode_arrays():
+    with open('/'.join((DATA_FOLDER, EPISODES_FILE))) as f:
+        episodes = _parse_episodes_arrays(f)
+
+    print '{0} episodes loaded.'.format(len(episodes))
+    return episodes.headers, episodes
+
+# Public classes and functions
+class Episodes(object):
+    """ All episode data, in a few flat arrays instead of millions of
+    tuples.
+
+    The measurements are sorted by episode, then variable, then in the
+    order they appear in the file:
+    - times, values: float arrays of the measurements.
+    - var: the variable of each measurement (0-indexed).
+    - offsets: the measurements of variable v of episode i are
+    offsets[k]:offsets[k + 1] with k = i * NUM_VARS + v.
+    - ids: the episode ids, in file order.
+    - headers: the headers of the episodes file.
+
+    """
+    def __init__(self, ids, times, values, var, offsets, headers=()):
+        self.ids = ids
+        self.times = times
+        self.values = values
+        self.var = var
+        self.offsets = offsets
+        self.headers = list(headers)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def series(self, i, v):
+        """ (times, values) of variable v in episode i, as array views """
+        k = i * NUM_VARS + v
+        start, end = self.offsets[k], self.offsets[k + 1]
+        return self.times[start:end], self.values[start:end]
+
+    def chunk(self, start, stop):
+        """ Episodes start to stop, sharing this object's arrays """
+        first, last = self.offsets[start * NUM_VARS], \
+            self.offsets[stop * NUM_VARS]
+        return Episodes(self.ids[start:stop], self.times[first:last],
+                        self.values[first:last], self.var[first:last],
+                        self.offsets[start * NUM_VARS:stop * NUM_VARS + 1] -
+                        first, self.headers)
+
+    def to_lists(self):
+        """ The list of (episode_id, episode_data) tuples load_episodes
+        returns by default
+        """
+        episodes = []
+        for i, id in enumerate(self.ids):
+            episode = defaultdict(list)
+            for v in range(NUM_VARS):
+                times, values = self.series(i, v)
+                if len(times):
+                    episode[v] = zip(times.tolist(), values.tolist())
+            episodes.append((int(id), episode))
+        return episodes
+
+    @classmethod
+    def from_lists(cls, episodes, headers=()):
+        """ Converts a list of (episode_id, episode_data) tuples """
+        ids, times, values, var, lengths = [], [], [], [], []
+        for id, episode in episodes:
+            ids.append(id)
+            for v in range(NUM_VARS):
+                measurements = episode.get(v, ()) if hasattr(episode, 'get') \
+                    else episode[v]
+                lengths.append(len(measurements))
+                for time, value in measurements:
+                    times.append(time)
+                    values.append(value)
+                    var.append(v)
+        offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+        return cls(np.asarray(ids), np.asarray(times, dtype=float),
+                   np.asarray(values, dtype=float),
+                   np.asarray(var, dtype=np.int16), offsets, headers)
+
 @utilities.timed
 @utilities.cached
-@utilities.pickled('/'.join((DATA_FOLDER, EPISODES_PICKLE)))
-def load_episodes():
+@utilities.disk_cached(CACHE_FOLDER, ['/'.join((DATA_FOLDER, EPISODES_FILE))])
+def load_episodes(columnar=False):
     """ Loads all episode data.
     
     Each of the 7890 episodes contains 13 physiological variables that are
     sampled very sparsely in time. 
 
-    Returns a list of (episode_id, episode_data) tuples. 
+    Returns the headers of the episodes file, and a list of
+    (episode_id, episode_data) tuples. 
     - episode_id is a an integer.
     - episode_data is a list of thirteen lists. Each of the thirteen lists
     contains measurements for a physiological variable. The measurements are
     a (time, value) tuple. Time and value are floats.
+
+    With columnar=True, the episodes are returned as an Episodes object
+    instead, which is far smaller and faster to load from the disk cache.
     
     """
-    with open('/'.join((DATA_FOLDER, EPISODES_FILE))) as f:
-        headers, episodes = _parse_episodes_file(f)
-            
-    print '{0} episodes loaded.'.format(len(episodes))
-    return headers, episodes
+    if columnar:
+        return _load_episode_arrays()
+    return _load_episode_lists()
 
 
 @utilities.timed
@@ -18,13 +18,34 @@ http://pydoc.net/scikit-learn/0.9/sklearn.datasets.base
 
 """
 
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import tempfile
 import numpy as np
 from sklearn.datasets.base import Bunch
+from sklearn import preprocessing
 import datafiles
 import utilities
 import features
 from utilities import unzip
 
+# Memory-mapped dataset artifacts: a header (magic, version and length of
+# the metadata), JSON metadata giving the dtype, shape and offset of each
+# array, then the arrays, each starting on an ARTIFACT_ALIGNMENT boundary.
+# Besides load_physio's arrays, an artifact can hold scaled_data: the data
+# scaled to zero mean and unit variance, its rows shuffled into order (the
+# indices of the original rows), so that any split is two slices of it.
+ARTIFACT_MAGIC = 'PHYA'
+ARTIFACT_VERSION = 2
+ARTIFACT_ALIGNMENT = 64
+ARTIFACT_ARRAYS = ('data', 'c_target', 'r_target', 'scaled_data', 'order')
+SHUFFLE_SEED = 0 # of the row order of scaled_data
+_ARTIFACT_HEADER = struct.Struct('<4sBI')
+
 def _compute_features(measurements, functions):
     """ Compute basic features for a time series of measurements """
     features = np.zeros(len(functions))
@@ -34,9 +55,175 @@ def _compute_features(measurements, functions):
             features[i] = f(values, times)
     return features
 
-@utilities.timed
-@utilities.cached
-def load_physio(feature_funcs):
+def _gather(values, starts, lengths, width):
+    """ The first width values of each segment as the rows of a 2D array,
+    with zeros past the end of the segment
+    """
+    columns = np.arange(width)
+    index = np.minimum(starts[:, None] + columns, len(values) - 1)
+    return np.where(columns < lengths[:, None], values[index], 0.0)
+
+def _pairwise_sum(values, starts, lengths):
+    """ Sums each segment in the same order as np.sum sums an array of
+    that length (8 partial sums, halving arrays over 128), so the sums are
+    bit for bit the same. Zeros are added where a segment is shorter than
+    others, which leaves the sums unchanged.
+    """
+    sums = np.zeros(len(starts))
+    short = lengths < 8
+    if short.any():
+        rows = _gather(values, starts[short], lengths[short], 7)
+        for i in range(7):
+            sums[short] += rows[:, i]
+    medium = (lengths >= 8) & (lengths <= 128)
+    if medium.any():
+        m_starts, m_lengths = starts[medium], lengths[medium]
+        blocked = m_lengths - m_lengths % 8
+        rows = _gather(values, m_starts, blocked, 128).reshape(-1, 16, 8)
+        r = rows[:, 0].copy()
+        for block in range(1, 16):
+            r += rows[:, block]
+        total = ((r[:, 0] + r[:, 1]) + (r[:, 2] + r[:, 3])) + \
+            ((r[:, 4] + r[:, 5]) + (r[:, 6] + r[:, 7]))
+        rest = _gather(values, m_starts + blocked, m_lengths % 8, 7)
+        for i in range(7):
+            total += rest[:, i]
+        sums[medium] = total
+    long = lengths > 128
+    if long.any():
+        l_starts, l_lengths = starts[long], lengths[long]
+        half = l_lengths // 2
+        half -= half % 8
+        sums[long] = _pairwise_sum(values, l_starts, half) + \
+            _pairwise_sum(values, l_starts + half, l_lengths - half)
+    return sums
+
+def _segment_sum(values, starts, lengths, buffer_size=8192):
+    """ The sum of each segment, exactly as np.sum would compute it: np.sum
+    adds up buffers of 8192 values one after another
+    """
+    sums = np.zeros(len(starts))
+    for offset in range(0, lengths.max() if len(lengths) else 0,
+                        buffer_size):
+        has = lengths > offset
+        sums[has] += _pairwise_sum(
+            values, starts[has] + offset,
+            np.minimum(lengths[has] - offset, buffer_size))
+    return sums
+
+# Segment reductions: each computes a feature for every non-empty series at
+# once, from the flat values and times, where series k starts at starts[k]
+# and has lengths[k] measurements. They give the same values as the
+# functions in features.py.
+def _segment_mean(values, times, starts, lengths):
+    return _segment_sum(values, starts, lengths) / lengths
+
+def _segment_var(values, times, starts, lengths):
+    mean = _segment_mean(values, times, starts, lengths)
+    deviations = values - np.repeat(mean, lengths)
+    return _segment_sum(deviations * deviations, starts, lengths) / lengths
+
+def _segment_std(values, times, starts, lengths):
+    return np.sqrt(_segment_var(values, times, starts, lengths))
+
+def _segment_max(values, times, starts, lengths):
+    return np.maximum.reduceat(values, starts)
+
+def _segment_min(values, times, starts, lengths):
+    return np.minimum.reduceat(values, starts)
+
+def _segment_range(values, times, starts, lengths):
+    return _segment_max(values, times, starts, lengths) - \
+        _segment_min(values, times, starts, lengths)
+
+def _segment_trend(values, times, starts, lengths):
+    ends = starts + lengths - 1
+    delta_value = values[ends] - values[starts]
+    delta_time = times[ends] - times[starts]
+    trend = np.zeros(len(starts))
+    ok = (lengths >= 2) & (delta_time != 0)
+    trend[ok] = delta_value[ok] / (delta_time[ok] / (24 * 60 * 60))
+    return trend
+
+_SEGMENT_FUNCTIONS = {features.mean: _segment_mean,
+                      features.std: _segment_std,
+                      features.var: _segment_var,
+                      features.max: _segment_max,
+                      features.min: _segment_min,
+                      features.range: _segment_range,
+                      features.trend: _segment_trend}
+
+def _compute_all_features(episodes, functions):
+    """ Computes the features of every series of a datafiles.Episodes,
+    returning the data matrix load_physio builds. Functions with a segment
+    reduction above are computed for all series at once, others one series
+    at a time. Empty series get 0 for every feature.
+    """
+    num_vars = datafiles.NUM_VARS
+    data = np.zeros((len(episodes), num_vars * len(functions)))
+    lengths = np.diff(episodes.offsets)
+    nonempty = np.flatnonzero(lengths)
+    starts = episodes.offsets[:-1][nonempty]
+    lengths = lengths[nonempty]
+    # column of feature f of variable v is v * len(functions) + f
+    rows = nonempty // num_vars
+    columns = nonempty % num_vars * len(functions)
+    for f, function in enumerate(functions):
+        if function in _SEGMENT_FUNCTIONS:
+            data[rows, columns + f] = _SEGMENT_FUNCTIONS[function](
+                episodes.values, episodes.times, starts, lengths)
+            continue
+        for row, column, start, length in zip(rows, columns, starts,
+                                              lengths):
+            data[row, column + f] = function(
+                episodes.values[start:start + length],
+                episodes.times[start:start + length])
+    return data
+
+def _init_worker(episodes, functions, output):
+    """ Runs in each worker process. The arguments are inherited when the
+    pool forks, so the episode arrays are shared rather than pickled.
+    """
+    global _shared
+    _shared = episodes, functions, output
+
+def _compute_chunk(rows):
+    """ Runs in a worker process: writes the features of episodes
+    rows[0] to rows[1] into the shared output matrix
+    """
+    episodes, functions, output = _shared
+    start, stop = rows
+    output[start:stop] = _compute_all_features(episodes.chunk(start, stop),
+                                               functions)
+
+def _compute_all_features_parallel(episodes, functions, processes=None,
+                                   chunk_size=500):
+    """ _compute_all_features on a pool of processes (one per core by
+    default), chunk_size episodes at a time. The workers write straight
+    into a matrix in shared memory.
+    """
+    shape = (len(episodes), datafiles.NUM_VARS * len(functions))
+    memory = mmap.mmap(-1, max(shape[0] * shape[1], 1) * 8)
+    output = np.frombuffer(memory, dtype=float,
+                           count=shape[0] * shape[1]).reshape(shape)
+    chunks = [(start, min(start + chunk_size, len(episodes)))
+              for start in range(0, len(episodes), chunk_size)]
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (episodes, functions, output))
+    try:
+        pool.map(_compute_chunk, chunks, 1)
+    finally:
+        pool.close()
+        pool.join()
+    return output.copy()
+
+_shared = None # (episodes, functions, output) in worker processes
+
+_INPUT_FILES = ['/'.join((datafiles.DATA_FOLDER, datafiles.EPISODES_FILE)),
+                '/'.join((datafiles.DATA_FOLDER, datafiles.OUTCOMES_FILE))]
+
+def _load_physio(feature_funcs, vectorized=True, processes=1,
+                 chunk_size=500):
     description = """ Loads a dataset containing physiological data. 
 
     It returns a Bunch with the following attributes:
@@ -50,23 +237,42 @@ def load_physio(feature_funcs):
     - DESCR: a description of this dataset (for now, the docstring of 
     this function)
 
+    With vectorized=True (the default), the features are computed from
+    the columnar episode arrays, all series at once where the feature
+    function allows it. Otherwise they are computed one series at a time.
+    The data is the same either way.
+
+    With processes other than 1, the episodes are split into chunks of
+    chunk_size and their features computed on a pool of that many
+    processes (None for one per core), which helps with feature functions
+    that cannot be vectorized. The data is still the same.
+
     """
-    headers, episodes = datafiles.load_episodes()
     headers, outcomes = datafiles.load_outcomes() # don't care about headers
+
+    if processes != 1:
+        headers, episodes = datafiles.load_episodes(columnar=True)
+        data = _compute_all_features_parallel(episodes, feature_funcs,
+                                              processes, chunk_size)
+    elif vectorized:
+        headers, episodes = datafiles.load_episodes(columnar=True)
+        data = _compute_all_features(episodes, feature_funcs)
+    else:
+        headers, episodes = datafiles.load_episodes()
     
-    # construct the prediction dataset
-    num_samples = len(episodes)
-    num_features = len(feature_funcs) * datafiles.NUM_VARS
-    data = np.zeros((num_samples, num_features))  
-
-    # for each sample (episode)
-    for i, (episode_id, episode_data) in enumerate(episodes):
-        # compute its features (stats for each physiological variable)
-        for v in range(datafiles.NUM_VARS):
-            start = v * len(feature_funcs)
-            end = (v + 1) * len(feature_funcs)
-            data[i, start:end] =_compute_features(episode_data[v], 
-                                                  feature_funcs)
+        # construct the prediction dataset
+        num_samples = len(episodes)
+        num_features = len(feature_funcs) * datafiles.NUM_VARS
+        data = np.zeros((num_samples, num_features))  
+
+        # for each sample (episode)
+        for i, (episode_id, episode_data) in enumerate(episodes):
+            # compute its features (stats for each physiological variable)
+            for v in range(datafiles.NUM_VARS):
+                start = v * len(feature_funcs)
+                end = (v + 1) * len(feature_funcs)
+                data[i, start:end] =_compute_features(episode_data[v], 
+                                                      feature_funcs)
 
     # obtain the target variables
     episode_ids, episode_outcomes = unzip(outcomes) 
@@ -84,6 +290,103 @@ def load_physio(feature_funcs):
                    DESCR=description) 
     return result
 
+@utilities.timed
+@utilities.cached
+@utilities.disk_cached(datafiles.CACHE_FOLDER, _INPUT_FILES)
+def load_physio(feature_funcs, vectorized=True, processes=1,
+                chunk_size=500):
+    """ The physiological dataset, cached in memory and on disk; see the
+    description in _load_physio
+    """
+    return _load_physio(feature_funcs, vectorized, processes, chunk_size)
+
+def save_physio_artifact(physio, path, feature_funcs=()):
+    """ Saves the data, c_target and r_target of a load_physio Bunch
+    (and scaled_data and order, if it has them) to path, so that
+    open_physio_artifact can map them into memory. The file is written
+    under a temporary name and renamed into place.
+    """
+    names = [name for name in ARTIFACT_ARRAYS if name in physio]
+    arrays = [np.ascontiguousarray(physio[name]) for name in names]
+    metadata = {'arrays': {},
+                'features': ['{0}.{1}'.format(f.__module__, f.__name__)
+                             for f in feature_funcs],
+                'DESCR': physio.get('DESCR', '')}
+    # offsets are relative to the end of the metadata, which is padded to
+    # the alignment so that every array starts aligned
+    offset = 0
+    for name, array in zip(names, arrays):
+        metadata['arrays'][name] = {'dtype': array.dtype.str,
+                                    'shape': array.shape, 'offset': offset}
+        offset += -(-array.nbytes // ARTIFACT_ALIGNMENT) * ARTIFACT_ALIGNMENT
+    encoded = json.dumps(metadata, sort_keys=True)
+    encoded += ' ' * (-(_ARTIFACT_HEADER.size + len(encoded)) %
+                      ARTIFACT_ALIGNMENT)
+
+    folder = os.path.dirname(path) or '.'
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_ARTIFACT_HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_VERSION,
+                                          len(encoded)))
+            f.write(encoded)
+            for array in arrays:
+                f.write(array.tostring())
+                f.write('\0' * (-array.nbytes % ARTIFACT_ALIGNMENT))
+        os.rename(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+def open_physio_artifact(path):
+    """ Opens an artifact written by save_physio_artifact, returning a
+    Bunch like load_physio's (plus the names of its feature functions in
+    feature_names). The arrays are read-only views of the file mapped into
+    memory, not copies, so every process that opens the artifact shares
+    the same pages.
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, length = _ARTIFACT_HEADER.unpack_from(mapped)
+    if magic != ARTIFACT_MAGIC or version != ARTIFACT_VERSION:
+        raise ValueError('not a version {0} physio artifact'.format(
+            ARTIFACT_VERSION))
+    start = _ARTIFACT_HEADER.size + length
+    metadata = json.loads(mapped[_ARTIFACT_HEADER.size:start])
+    arrays = {}
+    for name, info in metadata['arrays'].iteritems():
+        dtype = np.dtype(str(info['dtype']))
+        count = int(np.prod(info['shape']))
+        arrays[str(name)] = np.frombuffer(
+            mapped, dtype, count, start + info['offset']).reshape(
+                info['shape'])
+    return Bunch(DESCR=metadata['DESCR'],
+                 feature_names=metadata['features'], **arrays)
+
+def load_physio_mapped(feature_funcs):
+    """ load_physio, through a memory-mapped artifact in the cache folder
+    that is built the first time and shared by every process after that.
+    It also holds scaled_data and order, shuffled with SHUFFLE_SEED.
+    The artifact is named after the feature functions and the size and
+    modification time of the data files, so it is rebuilt when they change.
+    """
+    key = utilities._describe((feature_funcs,
+                               utilities._file_stamps(_INPUT_FILES),
+                               ARTIFACT_VERSION, SHUFFLE_SEED))
+    path = os.path.join(datafiles.CACHE_FOLDER, 'physio-{0}.bin'.format(
+        hashlib.sha1(key).hexdigest()))
+    if not os.path.exists(path):
+        # not load_physio, which would keep its own copy in its caches
+        physio = _load_physio(feature_funcs)
+        order = np.random.RandomState(SHUFFLE_SEED).permutation(
+            len(physio.data))
+        scaled_data = preprocessing.scale(physio.data)[order]
+        save_physio_artifact(Bunch(scaled_data=scaled_data, order=order,
+                                   **physio), path, feature_funcs)
+    return open_physio_artifact(path)
+
 @utilities.timed
 @utilities.cached
 def load_physio_stats():
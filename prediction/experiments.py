@@ -3,8 +3,6 @@ import pylab as pl
 import numpy as np
 from sklearn import svm, neighbors, tree, linear_model, metrics
 from sklearn import ensemble
-from sklearn import cross_validation
-from sklearn import preprocessing
 from sklearn.grid_search import GridSearchCV
 import datafiles
 import datasets
@@ -18,19 +16,24 @@ def _setup(test_size=0.75, classify=True):
     used for testing. 
     - classify: True if classification task, False if regression task.
 
+    The split is the same every time (see datasets.SHUFFLE_SEED), and X is
+    a read-only view of the memory-mapped dataset, shared by every process
+    that runs an experiment.
+
     """
-    # load dataset
-    physio = datasets.load_physio(features.TRY_THIS)
-    X = physio.data
-    y = physio.c_target if classify else physio.r_target
+    # load dataset, mapped from disk so that processes share one copy.
+    # Its features are already normalized (SVM classifier trains much much
+    # faster), and its rows shuffled
+    physio = datasets.load_physio_mapped(features.TRY_THIS)
+    X = physio.scaled_data # zero mean, unit variance
+    y = (physio.c_target if classify else physio.r_target)[physio.order]
     n_samples = X.shape[0]
 
-    # normalize features (SVM classifier trains much much faster)
-    X = preprocessing.scale(X) # zero mean, unit variance
-    
-    # construct training and testing sets
-    X_train, X_test, y_train, y_test =\
-        cross_validation.train_test_split(X, y, test_size=test_size)
+    # construct training and testing sets: as the rows are shuffled, slices
+    # make a random split without copying X
+    n_test = int(np.ceil(test_size * n_samples))
+    X_train, X_test = X[n_test:], X[:n_test]
+    y_train, y_test = y[n_test:], y[:n_test]
     
     return X_train, X_test, y_train, y_test
 
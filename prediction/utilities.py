@@ -4,8 +4,20 @@ utilities.py
 Various decorator classes and misc. utility functions.
 
 """
+from collections import OrderedDict
+import hashlib
+import os
+import sys
+import tempfile
+import threading
 import time
+import types
 import cPickle as pickle
+from cStringIO import StringIO
+import numpy as np
+
+MAX_ENTRIES = 32 # results a cached function keeps by default
+NBYTES_SAMPLE = 100 # items of a list measured to estimate its size
 
 class timed:
     """ Adds timing code to a function. """
@@ -13,65 +25,167 @@ class timed:
         self.function = function
         self.__name__ = function.__name__
     
-    def __call__(self, *args):
+    def __call__(self, *args, **kwargs):
         start = time.time()
-        result = self.function(*args)
+        result = self.function(*args, **kwargs)
         elapsed = time.time() - start
         print '{0} took {1}s'.format(self.function.__name__, round(elapsed, 4))
         return result
 
+    def __getattr__(self, name):
+        # so that cache methods are reachable through @timed
+        return getattr(self.function, name)
+
 class cached:
-    """ Caches the result of the function in memory. """
-    def __init__(self, function):
+    """ Caches the results of the function in memory, keeping the most
+    recently used ones: at most max_entries of them and, if max_bytes is
+    given, about max_bytes of NumPy arrays and other objects.
+
+    It is safe to call from several threads; each result is computed only
+    once while other threads asking for it wait. Use invalidate() to drop
+    a result, clear() to drop them all, and stats() for the number of
+    hits, misses, evictions, entries and bytes held. For other limits
+    than the defaults, decorate with cached_with(max_entries, max_bytes).
+
+    """
+    def __init__(self, function, max_entries=MAX_ENTRIES, max_bytes=None):
         self.function = function
         self.__name__ = function.__name__
-        self.cache = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict() # key -> (result, bytes), oldest first
+        self._pending = {} # key -> Event set when its result is ready
+        self._lock = threading.Lock()
+        self._counts = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes': 0}
+
+    def __call__(self, *args, **kwargs):
+        key = _cache_key(args, kwargs)
+        while True:
+            with self._lock:
+                if key in self.cache:
+                    self._counts['hits'] += 1
+                    result, size = self.cache.pop(key)
+                    self.cache[key] = (result, size) # most recently used
+                    return result
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._counts['misses'] += 1
+                    self._pending[key] = threading.Event()
+                    break
+            # another thread is computing it; wait, then look again (it
+            # may have failed, or the result already have been evicted)
+            pending.wait()
 
-    def __call__(self, *args):
         try:
-            return self.cache[args]
-        except KeyError:
-            self.cache[args] = self.function(*args)
-            return self.cache[args]
-
-class pickled:
-    """ Pickles the result of a function. Takes one argument, a file path 
-    for the  pickle.
-    
+            result = self.function(*args, **kwargs)
+            with self._lock:
+                self._add(key, result)
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+        return result
+
+    def _add(self, key, result):
+        size = _nbytes(result)
+        self.cache[key] = (result, size)
+        self._counts['bytes'] += size
+        while len(self.cache) > 1 and (
+                len(self.cache) > self.max_entries or
+                self.max_bytes is not None and
+                self._counts['bytes'] > self.max_bytes):
+            _, (_, evicted_size) = self.cache.popitem(last=False)
+            self._counts['bytes'] -= evicted_size
+            self._counts['evictions'] += 1
+
+    def invalidate(self, *args, **kwargs):
+        """ Drops the result for these arguments, if it is cached """
+        key = _cache_key(args, kwargs)
+        with self._lock:
+            if key in self.cache:
+                _, size = self.cache.pop(key)
+                self._counts['bytes'] -= size
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self._counts['bytes'] = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['entries'] = len(self.cache)
+            return stats
+
+def cached_with(max_entries=MAX_ENTRIES, max_bytes=None):
+    """ cached, with other limits """
+    return lambda function: cached(function, max_entries, max_bytes)
+
+class disk_cached:
+    """ Caches the result of a function on disk, in cache_folder. Entries
+    are keyed on a hash of the function's name, its arguments (functions
+    by their names) and the size and modification time of each of
+    input_files, so a changed input file is never served a stale result.
+
+    Each entry is one .npz file: NumPy arrays in the result are stored as
+    raw arrays, everything else as a highest protocol pickle. Entries are
+    written to a temporary file and renamed into place, so a reader never
+    sees half an entry. When the folder holds more than max_bytes, the
+    least recently used entries are deleted.
+
     """
-    def __init__(self, pickle_path):
-        self.pickle_path = pickle_path
+    def __init__(self, cache_folder, input_files=(), max_bytes=1 << 30):
+        self.cache_folder = cache_folder
+        self.input_files = input_files
+        self.max_bytes = max_bytes
 
     def __call__(self, function):
-        pickle_path = self.pickle_path
+        cache = self
         class wrapper:
             def __init__(self, function):
                 self.function = function
                 self.__name__ = function.__name__
-            
-            def __call__(self, *args):
-                # try unpickling
-                try: 
-                    file = open(pickle_path)
-                    result = pickle.load(file)
-                except (IOError, EOFError):
-                    pass # fail gracefully
+
+            def __call__(self, *args, **kwargs):
+                path = cache._path(self.function, args, kwargs)
+                try:
+                    result = _load_entry(path)
+                except (IOError, EOFError, KeyError, ValueError,
+                        pickle.UnpicklingError):
+                    pass # missing or unreadable, compute it again
                 else:
-                    file.close()
+                    os.utime(path, None) # mark as recently used
                     return result
-            
-                # otherwise load from file, and try pickling
-                result = function(*args)
-                try: 
-                    file = open(pickle_path, 'w')
-                    pickle.dump(result, file)
-                except IOError as e:
-                    print 'Error writing to pickle.'
-                else:
-                    file.close()
+
+                result = self.function(*args, **kwargs)
+                try:
+                    _save_entry(path, result)
+                    cache._evict()
+                except (IOError, OSError, pickle.PicklingError):
+                    print 'Error writing to the disk cache.'
                 return result
         return wrapper(function)
 
+    def _path(self, function, args, kwargs):
+        key = _describe((function, args, sorted(kwargs.items()),
+                         _file_stamps(self.input_files)))
+        name = '{0}-{1}.npz'.format(function.__name__,
+                                    hashlib.sha1(key).hexdigest())
+        return os.path.join(self.cache_folder, name)
+
+    def _evict(self):
+        """ Deletes the least recently used entries over max_bytes """
+        entries = []
+        for name in os.listdir(self.cache_folder):
+            if name.endswith('.npz'):
+                stat = os.stat(os.path.join(self.cache_folder, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_folder, name))
+            total -= size
+
 class safe:
     """ Modifies a function to return a specified value instead of throwing an 
     exception 
@@ -102,6 +216,114 @@ def safe_float(s):
 def safe_int(s):
     return int(s)
     
+def _describe(value):
+    """ A string that identifies value across runs (repr alone would give
+    functions by their address). Python functions are described by their
+    code as well as their name, so lambdas, and functions edited since,
+    are told apart.
+    """
+    if isinstance(value, (list, tuple)):
+        return '{0}({1})'.format(type(value).__name__,
+                                 ', '.join(map(_describe, value)))
+    elif isinstance(value, dict):
+        return _describe(sorted(value.items()))
+    elif isinstance(value, np.ndarray):
+        return 'array({0}, {1}, {2})'.format(
+            value.dtype, value.shape,
+            hashlib.sha1(np.ascontiguousarray(value)).hexdigest())
+    elif isinstance(value, types.FunctionType):
+        closure = [cell.cell_contents for cell in value.func_closure or ()]
+        return '{0}.{1}({2}, {3}, {4})'.format(
+            value.__module__, value.__name__, _describe(value.func_code),
+            _describe(value.func_defaults), _describe(closure))
+    elif isinstance(value, types.CodeType):
+        return 'code({0}, {1}, {2})'.format(
+            hashlib.sha1(value.co_code).hexdigest(),
+            _describe(value.co_consts), _describe(value.co_names))
+    elif callable(value) and hasattr(value, 'function'): # our decorators
+        return '{0}({1})'.format(value.__class__.__name__,
+                                 _describe(value.function))
+    elif callable(value) and hasattr(value, '__name__'):
+        return '{0}.{1}'.format(getattr(value, '__module__', ''),
+                                value.__name__)
+    return repr(value)
+
+def _file_stamps(paths):
+    """ (path, size, modification time) of each file, None if missing """
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append((path, stat.st_size, stat.st_mtime))
+        except OSError:
+            stamps.append((path, None, None))
+    return stamps
+
+def _cache_key(args, kwargs):
+    """ The arguments as a dict key, described by _describe if they are
+    not hashable (lists, arrays)
+    """
+    key = (args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return _describe(key)
+    return key
+
+def _nbytes(value):
+    """ Roughly the memory held by value: arrays by their data, containers
+    and objects by their contents. Long lists are estimated from a sample
+    of their items.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    elif isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_nbytes(k) + _nbytes(v)
+                                          for k, v in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        step = max(len(value) // NBYTES_SAMPLE, 1)
+        return sys.getsizeof(value) + \
+            sum(_nbytes(item) for item in value[::step]) * step
+    elif hasattr(value, '__dict__') and not callable(value):
+        return sys.getsizeof(value) + _nbytes(value.__dict__)
+    return sys.getsizeof(value)
+
+def _save_entry(path, result):
+    """ Saves result to path atomically, as a .npz file of its arrays and
+    a pickle of the rest
+    """
+    arrays = []
+    def persistent_id(obj):
+        if type(obj) is np.ndarray and obj.dtype != object:
+            arrays.append(obj)
+            return str(len(arrays) - 1)
+        return None
+    rest = StringIO()
+    pickler = pickle.Pickler(rest, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(result)
+
+    folder = os.path.dirname(path) or '.'
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, np.frombuffer(rest.getvalue(), dtype=np.uint8),
+                     *arrays)
+        os.rename(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+def _load_entry(path):
+    with open(path, 'rb') as f:
+        entry = np.load(f)
+        unpickler = pickle.Unpickler(StringIO(entry['arr_0'].tostring()))
+        unpickler.persistent_load = lambda id: entry['arr_{0}'.format(
+            int(id) + 1)]
+        return unpickler.load()
+
 def unzip(zipped):
     return zip(*zipped)
 